@@ -0,0 +1,138 @@
+"""Benchmark de extracción contra los stubs locales (sin red).
+
+Levanta `bench.stubs`, apunta los extractores a ellos y ejecuta
+`get_diabetes_obesity_data`, `fetch_world_bank_data` y
+`get_health_expenditure_data`, midiendo por fuente:
+    filas, tiempo de pared, peticiones/s, bytes/s (red, contados por el stub, y
+    cuerpo descomprimido) y pico de memoria (tracemalloc).
+
+Uso:
+    python -m bench.bench_extract --latency-ms 80 --repeat 3
+    python -m bench.bench_extract --sources worldbank --extra-countries 150 --json out.json
+
+La caché HTTP y la zona de landing se desactivan para medir solo la extracción;
+el memo de claves SDMX va a un fichero temporal.
+El limitador por host se fija alto por defecto (--http-rate) para no medirlo a él.
+"""
+
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from bench.stubs import StubConfig, StubServers
+
+SOURCES = {
+    "who": ("extract.who_gho", "get_diabetes_obesity_data"),
+    "worldbank": ("extract.world_bank", "fetch_world_bank_data"),
+    "sdmx": ("extract.sdmx", "get_health_expenditure_data"),
+}
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark de extracción contra stubs locales")
+    p.add_argument("--sources", default=",".join(SOURCES), help="Fuentes separadas por comas")
+    p.add_argument("--repeat", type=int, default=1, help="Repeticiones por fuente (se informa la mediana)")
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--year-min", type=int, default=1960)
+    p.add_argument("--year-max", type=int, default=2024)
+    p.add_argument("--extra-countries", type=int, default=0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--retry-after", type=int, default=0)
+    p.add_argument("--http-rate", type=float, default=1000.0, help="Ritmo inicial del limitador (req/s por host)")
+    p.add_argument("--json", metavar="PATH", help="Guarda también los resultados en JSON")
+    return p.parse_args(argv)
+
+
+def _measure(fn, host_of: str, stub_stats: dict, trace_memory: bool = False) -> dict:
+    """Ejecuta `fn()` una vez y devuelve sus métricas.
+
+    tracemalloc ralentiza el código con muchas asignaciones, así que el pico
+    de memoria se mide en una ejecución aparte (`trace_memory=True`).
+    """
+    from utils import http
+
+    http.reset_stats()
+    sent0 = stub_stats["bytes"]
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    df = fn()
+    wall = time.perf_counter() - t0
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    st = http.stats().get(host_of, {})
+    return {
+        "rows": len(df),
+        "wall_s": wall,
+        "requests": st.get("requests", 0),
+        "retries": st.get("retries", 0),
+        "wire_bytes": stub_stats["bytes"] - sent0,
+        "body_bytes": st.get("body_bytes", 0),
+        "peak_mb": peak / 1e6,
+    }
+
+
+def run(args: argparse.Namespace) -> dict[str, dict]:
+    cfg = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, year_min=args.year_min, year_max=args.year_max,
+        extra_countries=args.extra_countries, error_rate=args.error_rate, retry_after=args.retry_after,
+    )
+    results = {}
+    with StubServers(cfg) as stubs, tempfile.TemporaryDirectory(prefix="bench-extract-") as tmp:
+        # Antes de importar los extractores: leen URL base y configuración al importarse
+        os.environ.update(stubs.env)
+        os.environ["HTTP_CACHE"] = "0"
+        os.environ["LANDING"] = "0"
+        # Memo SDMX propio: las ganadoras de los stubs no deben llegar a data/sdmx_key_memo.json
+        os.environ["SDMX_KEY_MEMO"] = os.path.join(tmp, "sdmx_key_memo.json")
+        os.environ["HTTP_RATE"] = str(args.http_rate)
+        os.environ["HTTP_RATE_MAX"] = str(max(args.http_rate, float(os.getenv("HTTP_RATE_MAX", "32"))))
+
+        for source in [s.strip() for s in args.sources.split(",") if s.strip()]:
+            module, func = SOURCES[source]
+            fn = getattr(importlib.import_module(module), func)
+            host = f"{stubs.host}:{stubs.servers[source].server_port}"
+            runs = [_measure(fn, host, stubs.stats[source]) for _ in range(max(1, args.repeat))]
+            wall = statistics.median(r["wall_s"] for r in runs)
+            best = min(runs, key=lambda r: abs(r["wall_s"] - wall))
+            best["req_per_s"] = best["requests"] / wall if wall else 0.0
+            best["wire_mb_per_s"] = best["wire_bytes"] / 1e6 / wall if wall else 0.0
+            best["body_mb_per_s"] = best["body_bytes"] / 1e6 / wall if wall else 0.0
+            best["peak_mb"] = _measure(fn, host, stubs.stats[source], trace_memory=True)["peak_mb"]
+            best["stub"] = dict(stubs.stats[source])
+            results[source] = best
+    return results
+
+
+def _report(results: dict[str, dict]) -> None:
+    header = f"{'fuente':<10} {'filas':>8} {'pared s':>8} {'peticiones':>10} {'req/s':>8} " \
+             f"{'MB red/s':>9} {'MB cuerpo/s':>11} {'reintentos':>10} {'pico MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for source, r in results.items():
+        print(
+            f"{source:<10} {r['rows']:>8} {r['wall_s']:>8.2f} {r['requests']:>10} {r['req_per_s']:>8.1f} "
+            f"{r['wire_mb_per_s']:>9.2f} {r['body_mb_per_s']:>11.2f} {r['retries']:>10} {r['peak_mb']:>8.1f}"
+        )
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    results = run(args)
+    _report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"args": vars(args), "results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Benchmark de transformación (sin red ni Postgres).
+
+Genera un frame largo sintético (países × indicadores × años, con duplicados
+y nulos) y ejecuta `transform_who`, `transform_worldbank_population` y
+`transform_sdmx`, midiendo por fuente:
+    tiempo de pared, segundos por millón de filas y pico de memoria (tracemalloc
+    más el pool de Arrow, en una ejecución aparte porque tracemalloc ralentiza el
+    código con muchas asignaciones).
+
+Uso:
+    python -m bench.bench_transform --countries 300 --indicators 400 --years 30
+    python -m bench.bench_transform --input strings --json out.json
+    python -m bench.bench_transform --workers 8   # deduplicación en 8 procesos
+
+`--input strings` reproduce la salida de los extractores con texto (object);
+`--input compact` usa los tipos de utils.long_frame (category/int16, o columnas
+Arrow con PANDAS_DTYPE_BACKEND=pyarrow).
+"""
+
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import os
+import statistics
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+TRANSFORMS = {
+    "who": ("transform.who_gho_transform", "transform_who"),
+    "worldbank": ("transform.world_bank_transform", "transform_worldbank_population"),
+    "sdmx": ("transform.sdmx_transform", "transform_sdmx"),
+}
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark de transformación sobre un frame largo sintético")
+    p.add_argument("--sources", default=",".join(TRANSFORMS), help="Fuentes separadas por comas")
+    p.add_argument("--countries", type=int, default=200)
+    p.add_argument("--indicators", type=int, default=250)
+    p.add_argument("--years", type=int, default=30)
+    p.add_argument("--dup-rate", type=float, default=0.2, help="Fracción de filas duplicadas")
+    p.add_argument("--null-rate", type=float, default=0.01, help="Fracción de valores nulos")
+    p.add_argument("--input", choices=("strings", "compact"), default="compact")
+    p.add_argument("--repeat", type=int, default=3, help="Repeticiones por fuente (se informa la mediana)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--workers", type=int, help="TRANSFORM_WORKERS (sin mínimo de filas); por defecto, el del entorno")
+    p.add_argument("--json", metavar="PATH", help="Guarda también los resultados en JSON")
+    return p.parse_args(argv)
+
+
+def synthetic_long(args: argparse.Namespace) -> pd.DataFrame:
+    """Frame largo con países/indicadores con espacios y minúsculas (como en origen)."""
+    rng = np.random.default_rng(args.seed)
+    c, i, y = args.countries, args.indicators, args.years
+    n = c * i * y
+    df = pd.DataFrame({
+        "country": np.repeat(np.array([f" country {k:04d} " for k in range(c)], dtype=object), i * y),
+        "year": np.tile(np.arange(2024 - y + 1, 2025), c * i).astype("int64"),
+        "indicator": np.tile(np.repeat(np.array([f"indicator_{k:05d}" for k in range(i)], dtype=object), y), c),
+        "value": rng.random(n) * 1e6,
+    })
+    df.loc[rng.random(n) < args.null_rate, "value"] = np.nan
+    dups = df.sample(frac=args.dup_rate, random_state=args.seed) if args.dup_rate else df.iloc[:0]
+    df = pd.concat([df, dups], ignore_index=True)
+    if args.input == "compact":
+        from utils.long_frame import compact_long
+
+        df = compact_long(df)
+    return df
+
+
+class _ArrowPeak(threading.Thread):
+    """Muestrea la memoria del pool de Arrow (invisible para tracemalloc)."""
+
+    def __init__(self, interval: float = 0.001):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.base = pa.total_allocated_bytes()
+        self.peak = self.base
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, pa.total_allocated_bytes())
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return max(self.peak, pa.total_allocated_bytes()) - self.base
+
+
+def _measure(fn, df: pd.DataFrame, trace_memory: bool = False) -> dict:
+    if trace_memory:
+        arrow = _ArrowPeak()
+        arrow.start()
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(df)
+    wall = time.perf_counter() - t0
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak += arrow.stop()
+    return {"rows_out": len(out), "wall_s": wall, "peak_mb": peak / 1e6}
+
+
+def run(args: argparse.Namespace) -> dict[str, dict]:
+    df = synthetic_long(args)
+    mrows = len(df) / 1e6
+    results = {"_input": {"rows": len(df), "mb": df.memory_usage(deep=True).sum() / 1e6}}
+    for source in [s.strip() for s in args.sources.split(",") if s.strip()]:
+        module, func = TRANSFORMS[source]
+        fn = getattr(importlib.import_module(module), func)
+        runs = [_measure(fn, df) for _ in range(max(1, args.repeat))]
+        wall = statistics.median(r["wall_s"] for r in runs)
+        peak = _measure(fn, df, trace_memory=True)["peak_mb"]
+        results[source] = {
+            "rows_out": runs[0]["rows_out"],
+            "wall_s": wall,
+            "s_per_mrow": wall / mrows if mrows else 0.0,
+            "peak_mb": peak,
+            "peak_mb_per_mrow": peak / mrows if mrows else 0.0,
+        }
+    return results
+
+
+def _report(results: dict[str, dict]) -> None:
+    inp = results["_input"]
+    print(f"entrada: {inp['rows']} filas, {inp['mb']:.1f} MB")
+    header = f"{'fuente':<10} {'filas out':>10} {'pared s':>8} {'s/Mfila':>8} {'pico MB':>8} {'MB/Mfila':>9}"
+    print(header)
+    print("-" * len(header))
+    for source, r in results.items():
+        if source.startswith("_"):
+            continue
+        print(
+            f"{source:<10} {r['rows_out']:>10} {r['wall_s']:>8.2f} {r['s_per_mrow']:>8.2f} "
+            f"{r['peak_mb']:>8.1f} {r['peak_mb_per_mrow']:>9.1f}"
+        )
+
+
+def main(argv=None):
+    import logging
+
+    logging.disable(logging.INFO)  # sin los logs de cada transformación
+    args = _parse_args(argv)
+    if args.workers:
+        # Antes de importar las transformaciones (leen la configuración al importarse)
+        os.environ["TRANSFORM_WORKERS"] = str(args.workers)
+        os.environ["TRANSFORM_PARALLEL_MIN_ROWS"] = "0"
+    results = run(args)
+    _report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"args": vars(args), "results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
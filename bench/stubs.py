@@ -0,0 +1,320 @@
+"""Servidores HTTP locales que imitan las APIs de WHO GHO, World Bank y OCDE SDMX.
+
+Sirven payloads sintéticos (deterministas) con el mismo formato que las APIs
+reales para medir la extracción sin red:
+    - GHO:  GET /api/<INDICADOR>[?$filter=...&$select=...] → {"value": [...]}
+    - WB:   GET /v2/country/<ISO3;...>/indicator/<COD;...>?date=&per_page=&page= → [meta, rows]
+    - SDMX: GET /public/rest/data/<flujo>/<clave>?startPeriod=&endPeriod=&format=jsondata|csvfile
+
+Parámetros (StubConfig): latencia por petición, tamaño del payload (años y
+países extra que el cliente descarta) e inyección de errores 429/503 con
+Retry-After. Los extractores se apuntan a los stubs con GHO_BASE_URL,
+WB_BASE_URL y SDMX_BASE_URL (ver `StubServers.env`).
+
+Uso directo (deja los servidores levantados):
+    python -m bench.stubs --latency-ms 50 --error-rate 0.02
+"""
+
+from __future__ import annotations
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from extract.constants import COUNTRY_CODES
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0        # retardo fijo por petición
+    jitter_ms: float = 0.0         # retardo aleatorio adicional U(0, jitter)
+    year_min: int = 1960           # años servidos (antes de aplicar filtros de la petición)
+    year_max: int = 2024
+    extra_countries: int = 0       # países sintéticos que el cliente debe descartar
+    error_rate: float = 0.0        # probabilidad de responder 429/503 en lugar de datos
+    retry_after: int = 0           # Retry-After (s) en los 429 inyectados
+    missing_rate: float = 0.05     # fracción de observaciones sin valor
+    gzip: bool = True              # comprimir si el cliente envía Accept-Encoding: gzip
+    seed: int = 0
+
+
+def _value(*key) -> float:
+    """Valor pseudoaleatorio estable para una clave (mismo payload en cada ejecución)."""
+    h = int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), "little")
+    return round((h % 1_000_000) / 1000, 3)
+
+
+def _countries(cfg: StubConfig) -> list[str]:
+    return list(COUNTRY_CODES.values()) + [f"X{i:02d}" for i in range(cfg.extra_countries)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Base común: latencia, inyección de errores, compresión y contadores."""
+
+    protocol_version = "HTTP/1.1"
+    cfg: StubConfig
+    stats: dict
+
+    def log_message(self, *args):  # silencio: el benchmark mide, no registra
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict | None = None) -> None:
+        if self.cfg.gzip and "gzip" in self.headers.get("Accept-Encoding", "") and body:
+            body = gzip.compress(body, compresslevel=1)
+            headers = {**(headers or {}), "Content-Encoding": "gzip"}
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += len(body)
+            self.stats["errors"] += int(status >= 400)
+
+    def do_GET(self):
+        delay = self.cfg.latency_ms + random.uniform(0, self.cfg.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        if self.cfg.error_rate and random.random() < self.cfg.error_rate:
+            if random.random() < 0.5:
+                self._send(429, b"", "text/plain", {"Retry-After": str(self.cfg.retry_after)})
+            else:
+                self._send(503, b"", "text/plain")
+            return
+        url = urlsplit(self.path)  # urlparse separaría ";A;B" (lotes WB) como params
+        query = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        try:
+            status, body, ctype = self.respond(unquote(url.path), query)
+        except Exception as e:  # error del stub → 500 visible en el benchmark
+            status, body, ctype = 500, str(e).encode(), "text/plain"
+        self._send(status, body, ctype)
+
+    def respond(self, path: str, query: dict) -> tuple[int, bytes, str]:
+        raise NotImplementedError
+
+
+class GhoHandler(_Handler):
+    """OData GHO: respeta `SpatialDim eq`, `TimeDim ge/le` y `$select`."""
+
+    def respond(self, path, query):
+        code = path.rstrip("/").rsplit("/", 1)[-1]
+        flt = query.get("$filter", "")
+        wanted = set(re.findall(r"SpatialDim eq '(\w+)'", flt)) or None
+        ge = re.search(r"TimeDim ge (\d+)", flt)
+        le = re.search(r"TimeDim le (\d+)", flt)
+        y0 = max(self.cfg.year_min, int(ge.group(1))) if ge else self.cfg.year_min
+        y1 = min(self.cfg.year_max, int(le.group(1))) if le else self.cfg.year_max
+        select = query.get("$select", "").split(",") if query.get("$select") else None
+
+        rows = []
+        for i, (c, y) in enumerate(itertools.product(_countries(self.cfg), range(y0, y1 + 1))):
+            if wanted is not None and c not in wanted:
+                continue
+            v = _value("who", code, c, y)
+            rec = {
+                "Id": i, "IndicatorCode": code, "SpatialDimType": "COUNTRY", "SpatialDim": c,
+                "TimeDimType": "YEAR", "TimeDim": y, "Dim1Type": "SEX", "Dim1": "SEX_BTSX",
+                "Dim2Type": None, "Dim2": None, "Dim3Type": None, "Dim3": None,
+                "DataSourceDimType": None, "DataSourceDim": None,
+                "Value": f"{v:.1f} [{v * 0.9:.1f}-{v * 1.1:.1f}]", "NumericValue": v,
+                "Low": v * 0.9, "High": v * 1.1, "Comments": None,
+                "Date": "2024-01-01T00:00:00+01:00", "TimeDimensionValue": str(y),
+                "TimeDimensionBegin": f"{y}-01-01T00:00:00+01:00", "TimeDimensionEnd": f"{y}-12-31T00:00:00+01:00",
+            }
+            rows.append({k: rec[k] for k in select} if select else rec)
+        body = {"@odata.context": f"https://ghoapi.azureedge.net/api/$metadata#{code}", "value": rows}
+        return 200, json.dumps(body).encode(), "application/json"
+
+
+class WorldBankHandler(_Handler):
+    """API v2 del Banco Mundial: paginación `[meta, rows]`, listas 'A;B' de países e indicadores."""
+
+    def respond(self, path, query):
+        m = re.search(r"/country/([^/]+)/indicator/([^/]+)$", path)
+        if not m:
+            return 404, b"[]", "application/json"
+        countries = m.group(1).split(";") + [f"X{i:02d}" for i in range(self.cfg.extra_countries)]
+        codes = m.group(2).split(";")
+        y0, _, y1 = query.get("date", f"{self.cfg.year_min}:{self.cfg.year_max}").partition(":")
+        y0, y1 = max(int(y0), self.cfg.year_min), min(int(y1 or y0), self.cfg.year_max)
+        per_page, page = int(query.get("per_page", 50)), int(query.get("page", 1))
+
+        # Mismo orden que la API: indicador, país, año descendente
+        keys = [(code, c, y) for code in codes for c in countries for y in range(y1, y0 - 1, -1)]
+        total = len(keys)
+        pages = max(1, -(-total // per_page))
+        rows = []
+        for code, c, y in keys[(page - 1) * per_page: page * per_page]:
+            v = _value("wb", code, c, y)
+            missing = (v * 1000) % 1000 < self.cfg.missing_rate * 1000
+            rows.append({
+                "indicator": {"id": code, "value": code},
+                "country": {"id": c[:2], "value": c},
+                "countryiso3code": c,
+                "date": str(y),
+                "value": None if missing else v,
+                "unit": "", "obs_status": "", "decimal": 1,
+            })
+        meta = {"page": page, "pages": pages, "per_page": per_page, "total": total,
+                "sourceid": query.get("source", "2"), "lastupdated": "2024-06-28"}
+        return 200, json.dumps([meta, rows or None]).encode(), "application/json"
+
+
+class SdmxHandler(_Handler):
+    """REST SDMX 2.1: producto cartesiano de los códigos de la clave × años.
+
+    Posición 0 de la clave = REF_AREA (vacía → todos los países); el resto de
+    posiciones vacías se sirven con un único código `_Z`. En el flujo SHA las
+    posiciones 3 y 6 se llaman UNIT_MEASURE y FUNCTION, como en la DSD real.
+    """
+
+    NAMED = {"DF_SHA": {3: "UNIT_MEASURE", 6: "FUNCTION"}}
+
+    def respond(self, path, query):
+        m = re.search(r"/data/([^/]+)/([^/]+)$", path)
+        if not m:
+            return 404, b"NoResultsFound", "text/plain"
+        flow, key = m.group(1), m.group(2)
+        names = next((v for k, v in self.NAMED.items() if k in flow), {})
+        segments = key.split(".")
+        dims = []
+        for i, seg in enumerate(segments):
+            if i == 0:
+                codes = seg.split("+") if seg else _countries(self.cfg)
+            else:
+                codes = seg.split("+") if seg else ["_Z"]
+            dims.append((names.get(i, "REF_AREA" if i == 0 else f"DIM{i}"), codes))
+        y0 = max(self.cfg.year_min, int(query.get("startPeriod", self.cfg.year_min)))
+        y1 = min(self.cfg.year_max, int(query.get("endPeriod", self.cfg.year_max)))
+        years = [str(y) for y in range(y0, y1 + 1)]
+        dims.append(("TIME_PERIOD", years))
+
+        obs = []
+        for idx in itertools.product(*(range(len(codes)) for _, codes in dims)):
+            v = _value("sdmx", flow, *(dims[d][1][i] for d, i in enumerate(idx)))
+            if (v * 1000) % 1000 < self.cfg.missing_rate * 1000:
+                continue
+            obs.append((idx, v))
+        if not obs:
+            return 404, b"NoResultsFound", "text/plain"
+
+        if query.get("format") == "csvfile":
+            # DATAFLOW en notación SDMX-CSV (AGENCIA:ID(VERSIÓN)): sin comas en el campo
+            agency, flow_id, version = (flow.split(",") + ["", ""])[:3]
+            dataflow = f"{agency}:{flow_id}({version or '1.0'})"
+            header = ["DATAFLOW"] + [d for d, _ in dims] + ["OBS_VALUE", "OBS_STATUS"]
+            lines = [",".join(header)]
+            for idx, v in obs:
+                lines.append(",".join([dataflow] + [dims[d][1][i] for d, i in enumerate(idx)] + [str(v), "A"]))
+            return 200, ("\n".join(lines) + "\n").encode(), "application/vnd.sdmx.data+csv"
+
+        body = {
+            "data": {
+                "dataSets": [{
+                    "action": "Information",
+                    "observations": {":".join(map(str, idx)): [v, 0] for idx, v in obs},
+                }],
+                "structures": [{
+                    "dimensions": {
+                        "observation": [
+                            {"id": d, "keyPosition": i, "values": [{"id": c, "name": c} for c in codes]}
+                            for i, (d, codes) in enumerate(dims)
+                        ]
+                    },
+                    "attributes": {"observation": [{"id": "OBS_STATUS", "values": [{"id": "A"}]}]},
+                }],
+            }
+        }
+        return 200, json.dumps(body).encode(), "application/vnd.sdmx.data+json"
+
+
+HANDLERS = {
+    "who": (GhoHandler, "GHO_BASE_URL", "/api"),
+    "worldbank": (WorldBankHandler, "WB_BASE_URL", "/v2"),
+    "sdmx": (SdmxHandler, "SDMX_BASE_URL", "/public/rest"),
+}
+
+
+class StubServers:
+    """Los tres stubs en hilos de fondo, cada uno en su puerto."""
+
+    def __init__(self, cfg: StubConfig | None = None, host: str = "127.0.0.1"):
+        self.cfg = cfg or StubConfig()
+        self.host = host
+        self.servers: dict[str, ThreadingHTTPServer] = {}
+        self.stats: dict[str, dict] = {}
+        self.env: dict[str, str] = {}
+
+    def start(self) -> dict[str, str]:
+        """Arranca los servidores y devuelve {variable de entorno: URL base}."""
+        random.seed(self.cfg.seed)
+        env = {}
+        for source, (handler, env_var, prefix) in HANDLERS.items():
+            stats = self.stats[source] = {"requests": 0, "bytes": 0, "errors": 0}
+            cls = type(handler.__name__, (handler,), {"cfg": self.cfg, "stats": stats})
+            srv = ThreadingHTTPServer((self.host, 0), cls)
+            srv.daemon_threads = True
+            srv.lock = threading.Lock()
+            threading.Thread(target=srv.serve_forever, name=f"stub-{source}", daemon=True).start()
+            self.servers[source] = srv
+            env[env_var] = f"http://{self.host}:{srv.server_port}{prefix}"
+        self.env = env
+        return env
+
+    def stop(self) -> None:
+        for srv in self.servers.values():
+            srv.shutdown()
+            srv.server_close()
+        self.servers.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Stubs locales de las APIs WHO GHO / World Bank / OCDE SDMX")
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--year-min", type=int, default=1960)
+    p.add_argument("--year-max", type=int, default=2024)
+    p.add_argument("--extra-countries", type=int, default=0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--retry-after", type=int, default=0)
+    p.add_argument("--no-gzip", action="store_true")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    cfg = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, year_min=args.year_min, year_max=args.year_max,
+        extra_countries=args.extra_countries, error_rate=args.error_rate, retry_after=args.retry_after,
+        gzip=not args.no_gzip,
+    )
+    stubs = StubServers(cfg)
+    for var, url in stubs.start().items():
+        print(f"{var}={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
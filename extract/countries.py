@@ -0,0 +1,133 @@
+"""Universo de países de la extracción y troceo de listas de países para URLs.
+
+El universo (nombre → ISO3) se toma, por orden de prioridad, de:
+    COUNTRY_UNIVERSE_FILE    CSV con columnas `country,iso3`
+    COUNTRY_UNIVERSE_TABLE   tabla Postgres (`esquema.tabla`) con columnas country, iso3
+    extract.constants.COUNTRY_CODES (47 países, por defecto)
+
+Las APIs reciben los países en la URL (ruta WB, $filter OData de GHO, clave
+SDMX). Con universos grandes (~217 economías WB) la URL supera los límites de
+los servidores, así que `chunk_codes` trocea la lista para que cada URL quepa
+en COUNTRY_URL_MAX caracteres y `map_chunks` descarga los trozos en paralelo.
+
+Uso:
+    python -m extract.countries --world-bank data/country_universe.csv
+"""
+
+from __future__ import annotations
+import argparse
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Sequence, TypeVar
+
+from extract.constants import COUNTRY_CODES
+from utils.logging import get_logger
+
+log = get_logger(__name__)
+
+COUNTRY_UNIVERSE_FILE = os.getenv("COUNTRY_UNIVERSE_FILE", "")
+COUNTRY_UNIVERSE_TABLE = os.getenv("COUNTRY_UNIVERSE_TABLE", "")
+# Longitud máxima de URL (conservadora: proxies/CDN suelen cortar en 2-8 KB)
+COUNTRY_URL_MAX = int(os.getenv("COUNTRY_URL_MAX", "2000"))
+# Trozos de países descargados en paralelo por consulta
+COUNTRY_CHUNK_WORKERS = max(1, int(os.getenv("COUNTRY_CHUNK_WORKERS", "4")))
+
+T = TypeVar("T")
+
+
+def _read_file(path: Path) -> dict[str, str]:
+    with path.open(newline="", encoding="utf-8") as fh:
+        return {row["country"].strip(): row["iso3"].strip().upper() for row in csv.DictReader(fh) if row.get("iso3")}
+
+
+def _read_table(table: str) -> dict[str, str]:
+    from sqlalchemy import text
+    from utils.db import get_engine
+
+    schema, _, name = table.rpartition(".")
+    qualified = f'"{schema}"."{name}"' if schema else f'"{name}"'
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(f"SELECT country, iso3 FROM {qualified} ORDER BY iso3")).all()
+    return {str(country).strip(): str(iso3).strip().upper() for country, iso3 in rows}
+
+
+@lru_cache(maxsize=1)
+def country_codes() -> dict[str, str]:
+    """Universo de países configurado (nombre → ISO3)."""
+    if COUNTRY_UNIVERSE_FILE:
+        codes, origin = _read_file(Path(COUNTRY_UNIVERSE_FILE)), COUNTRY_UNIVERSE_FILE
+    elif COUNTRY_UNIVERSE_TABLE:
+        codes, origin = _read_table(COUNTRY_UNIVERSE_TABLE), COUNTRY_UNIVERSE_TABLE
+    else:
+        return dict(COUNTRY_CODES)
+    if not codes:
+        raise RuntimeError(f"Universo de países vacío en {origin}")
+    log.info("Universo de países: %d desde %s", len(codes), origin)
+    return codes
+
+
+def iso3_codes() -> list[str]:
+    return list(country_codes().values())
+
+
+def code_to_name() -> dict[str, str]:
+    return {iso3: name for name, iso3 in country_codes().items()}
+
+
+def chunk_codes(codes: Sequence[str], render: Callable[[list[str]], str], max_len: int | None = None) -> list[list[str]]:
+    """Trocea `codes` en orden para que `render(trozo)` (la URL completa) no pase de `max_len`.
+
+    Un código que por sí solo no cabe va en su propio trozo (la API decidirá).
+    """
+    max_len = max_len or COUNTRY_URL_MAX
+    chunks: list[list[str]] = []
+    current: list[str] = []
+    for code in codes:
+        if current and len(render(current + [code])) > max_len:
+            chunks.append(current)
+            current = []
+        current.append(code)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def map_chunks(fn: Callable[[list[str]], T], chunks: list[list[str]], workers: int | None = None) -> list[T]:
+    """Aplica `fn` a cada trozo (en paralelo si hay varios); resultados en el orden de los trozos."""
+    workers = min(workers or COUNTRY_CHUNK_WORKERS, len(chunks))
+    if workers <= 1:
+        return [fn(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, chunks))
+
+
+def world_bank_economies() -> dict[str, str]:
+    """Economías de la API del Banco Mundial (sin agregados regionales/de renta)."""
+    from extract.world_bank import WB_BASE_URL
+    from utils import http
+
+    rows = http.get_json(f"{WB_BASE_URL}/country?format=json&per_page=500")[1]
+    return {
+        r["name"]: r["id"]
+        for r in rows
+        if r.get("region", {}).get("id") not in (None, "", "NA") and len(r.get("id", "")) == 3
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Genera un fichero de universo de países (country,iso3)")
+    p.add_argument("--world-bank", metavar="PATH", required=True, help="CSV de salida con todas las economías WB")
+    args = p.parse_args(argv)
+    codes = world_bank_economies()
+    with open(args.world_bank, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh)
+        w.writerow(["country", "iso3"])
+        w.writerows(sorted(codes.items()))
+    log.info("Escritos %d países en %s", len(codes), args.world_bank)
+
+
+if __name__ == "__main__":
+    main()
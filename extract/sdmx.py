@@ -1,124 +1,418 @@
 """
 Extracción SDMX (OECD) con intentos de fallback (unidad/categoría) y salida homogénea.
 """
-import requests
+import csv
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
 import pandas as pd
-from extract.constants import COUNTRY_CODES
-from typing import Optional, Union, List
+import requests
+from pandas.api.types import union_categoricals
+from extract import countries as country_universe
+from typing import Iterable, Optional, Union, List
+from utils import http
+from utils.config import DATA_DIR, YEAR_MIN, YEAR_MAX
+from utils.watermark import Watermark, updated_after as _updated_after
 from utils.logging import get_logger
+from utils.long_frame import compact_long, empty_long
 
 log = get_logger(__name__)
 
+# URL base del servicio REST SDMX de la OCDE (configurable, p.ej. bench/stubs.py)
+SDMX_BASE_URL = os.getenv("SDMX_BASE_URL", "https://sdmx.oecd.org/public/rest").rstrip("/")
+
+
+def _sdmx_payload(data: dict) -> Optional[tuple]:
+    """(dataset, dimensiones de observación) de un mensaje SDMX-JSON; None si no hay datos."""
+    # Validación mínima de estructura SDMX
+    if "data" not in data or "dataSets" not in data["data"] or not data["data"]["dataSets"]:
+        return None
+    dataset = data["data"]["dataSets"][0]
+    structure = data["data"]["structures"][0]
+    if "observations" not in dataset:
+        return None
+    return dataset, structure["dimensions"]["observation"]
+
+
+def _decode_observations(dataset: dict, obs_dims: List[dict], dim_ids: List[str]) -> pd.DataFrame:
+    """Decodifica `dataset["observations"]` de forma vectorizada.
+
+    Las claves "i:j:k:...:t" se convierten de una vez en una matriz de índices
+    (n_obs × n_dims); cada dimensión pedida se resuelve con un `take` sobre el
+    array de códigos de esa dimensión. Índices fuera de rango → None.
+    Devuelve una columna por id de `dim_ids` más `value` (float, NaN si falta).
+    """
+    observations = dataset.get("observations") or {}
+    n = len(observations)
+    if not n:
+        return pd.DataFrame(columns=[*dim_ids, "value"])
+
+    # Cada key es una tupla indexada en formato "i:j:k:...:t"
+    idx = np.fromstring(":".join(observations.keys()), dtype=np.int64, sep=":")
+    if idx.size != n * len(obs_dims):
+        raise ValueError("Claves de observación SDMX con número de dimensiones inesperado")
+    idx = idx.reshape(n, len(obs_dims))
+
+    positions = {dim["id"]: i for i, dim in enumerate(obs_dims)}
+    cols = {}
+    for dim_id in dim_ids:
+        pos = positions.get(dim_id)
+        if pos is None:
+            cols[dim_id] = np.full(n, None, dtype=object)
+            continue
+        # Último hueco = None para índices fuera de rango (validación de límites)
+        codes = np.array([v.get("id") for v in obs_dims[pos]["values"]] + [None], dtype=object)
+        col = idx[:, pos]
+        cols[dim_id] = codes.take(np.where((col >= 0) & (col < len(codes) - 1), col, len(codes) - 1))
+
+    cols["value"] = np.fromiter(
+        (v[0] if v and v[0] is not None else np.nan for v in observations.values()),
+        dtype=np.float64, count=n,
+    )
+    return pd.DataFrame(cols)
+
+
+# Formato de descarga SDMX: "json" (SDMX-JSON, por defecto) o "csv" (SDMX-CSV en streaming, por trozos)
+SDMX_FORMAT = os.getenv("SDMX_FORMAT", "json").lower()
+SDMX_CSV_CHUNK_ROWS = int(os.getenv("SDMX_CSV_CHUNK_ROWS", "200000"))
+
+# Columnas de identificación del mensaje SDMX-CSV (v1 y v2) previas a las dimensiones
+_CSV_ID_COLS = {"DATAFLOW", "STRUCTURE", "STRUCTURE_ID", "STRUCTURE_NAME", "ACTION"}
+
+
+class _ChunkReader(io.RawIOBase):
+    """Fichero de solo lectura sobre un iterador de trozos de bytes (para `pd.read_csv`)."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            self._buf = next(self._chunks, None)
+            if self._buf is None:
+                self._buf = b""
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _read_sdmx_csv(chunks: Iterable[bytes]) -> Optional[tuple]:
+    """SDMX-CSV en streaming → (dims, DataFrame con una columna categórica por dimensión + `value`).
+
+    Se leen solo las dimensiones (columnas entre la identificación y OBS_VALUE)
+    y OBS_VALUE, por trozos de SDMX_CSV_CHUNK_ROWS filas con el lector C de
+    pandas según llega la respuesta; los atributos se descartan. De cada trozo
+    se conservan solo las filas con valor, año y país del universo, así que la
+    memoria depende de las filas útiles y no del tamaño de la descarga.
+    `dims` recoge los códigos vistos por dimensión antes de filtrar.
+    """
+    stream = io.BufferedReader(_ChunkReader(chunks), buffer_size=1 << 16)
+    header = next(csv.reader([stream.readline().decode("utf-8-sig")]), [])
+    if "OBS_VALUE" not in header:
+        return None
+    dims = [c for c in header[: header.index("OBS_VALUE")] if c not in _CSV_ID_COLS]
+    reader = pd.read_csv(
+        stream,
+        header=None, names=header,
+        usecols=dims + ["OBS_VALUE"],
+        dtype={**{d: "category" for d in dims}, "OBS_VALUE": "float64"},
+        keep_default_na=False, na_values=[""],
+        chunksize=SDMX_CSV_CHUNK_ROWS,
+    )
+    universe = set(country_universe.iso3_codes())
+    seen: dict[str, dict] = {d: {} for d in dims}
+    chunks_kept = []
+    for chunk in reader:
+        for d in dims:
+            seen[d].update(dict.fromkeys(str(x) for x in chunk[d].cat.categories))
+        keep = chunk["OBS_VALUE"].notna()
+        if "TIME_PERIOD" in chunk:
+            keep &= chunk["TIME_PERIOD"].notna()
+        if "REF_AREA" in chunk:
+            keep &= chunk["REF_AREA"].isin(universe)
+        if keep.any():
+            chunks_kept.append(chunk[keep])
+    if not chunks_kept:
+        return None
+    out = pd.DataFrame({
+        d: union_categoricals([c[d] for c in chunks_kept]) if len(chunks_kept) > 1 else chunks_kept[0][d].values
+        for d in dims
+    })
+    out["value"] = np.concatenate([c["OBS_VALUE"].to_numpy() for c in chunks_kept])
+    return {d: list(codes) for d, codes in seen.items()}, out[dims + ["value"]]
+
+
+def _fetch_observations(url: str, updated_after: Optional[datetime] = None) -> Optional[tuple]:
+    """Descarga una consulta SDMX (sin parámetro `format`) en el formato configurado.
+
+    Con `updated_after` solo se piden las observaciones modificadas desde esa
+    marca (parámetro SDMX `updatedAfter`); un 404 significa entonces "sin cambios".
+    Devuelve (dims, decode) o None si no hay datos:
+        dims   → {id dimensión: [códigos]} en el orden de la DSD.
+        decode → función(dim_ids) que devuelve las observaciones con esas
+                 columnas de dimensión + `value` (ver _decode_observations).
+    """
+    sep = "&" if "?" in url else "?"
+    if updated_after is not None:
+        url += f"{sep}updatedAfter={updated_after.astimezone(timezone.utc):%Y-%m-%dT%H:%M:%SZ}"
+        sep = "&"
+    if SDMX_FORMAT == "csv":
+        try:
+            chunks = http.iter_body(f"{url}{sep}format=csvfile")
+        except requests.HTTPError as e:
+            if updated_after is not None and e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+        parsed = _read_sdmx_csv(chunks)
+        if parsed is None:
+            return None
+        dims, frame = parsed
+
+        def decode(dim_ids: List[str]) -> pd.DataFrame:
+            cols = {d: (frame[d].astype(object) if d in frame else None) for d in dim_ids}
+            return pd.DataFrame({**cols, "value": frame["value"]})
+
+        return dims, decode
+
+    response = http.get(f"{url}{sep}format=jsondata")
+    if updated_after is not None and response.status_code == 404:
+        return None
+    response.raise_for_status()
+    payload = _sdmx_payload(response.json())
+    if payload is None:
+        return None
+    dataset, obs_dims = payload
+    dims = {d["id"]: [v.get("id") for v in d.get("values", [])] for d in obs_dims}
+    return dims, lambda dim_ids: _decode_observations(dataset, obs_dims, dim_ids)
+
+
+def _to_long(obs: pd.DataFrame, indicator) -> pd.DataFrame:
+    """Observaciones decodificadas → (country, year, value, indicator).
+
+    Conserva solo filas con valor y país del universo configurado. `indicator`
+    puede ser un nombre fijo o una Serie alineada con `obs`.
+    """
+    code_to_name = country_universe.code_to_name()
+    country = obs["REF_AREA"].map(code_to_name)
+    keep = country.notna() & obs["value"].notna() & obs["TIME_PERIOD"].notna()
+    if not keep.any():
+        return empty_long()
+    out = pd.DataFrame({
+        "country": country[keep],
+        "year": obs.loc[keep, "TIME_PERIOD"].astype(int),
+        "value": obs.loc[keep, "value"],
+        "indicator": indicator[keep] if isinstance(indicator, pd.Series) else indicator,
+    })
+    return out.reset_index(drop=True)
+
+
+# Memo local de la combinación (unidad, categoría) ganadora por indicador
+SDMX_KEY_MEMO = Path(os.getenv("SDMX_KEY_MEMO", str(DATA_DIR / "sdmx_key_memo.json")))
+_MEMO_LOCK = threading.Lock()
+
+
+def _memo_read() -> dict:
+    try:
+        return json.loads(SDMX_KEY_MEMO.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _memo_update(indicator_name: str, combo: Optional[tuple]) -> None:
+    """Guarda (o borra si combo=None) la combinación ganadora; escritura atómica."""
+    with _MEMO_LOCK:
+        memo = _memo_read()
+        if combo is None:
+            if memo.pop(indicator_name, None) is None:
+                return
+        else:
+            memo[indicator_name] = {"unit_measure": combo[0], "sha_category": combo[1]}
+        SDMX_KEY_MEMO.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SDMX_KEY_MEMO.with_suffix(".tmp")
+        tmp.write_text(json.dumps(memo, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, SDMX_KEY_MEMO)
+
+
+def _time_params(start_period: Optional[int] = None) -> str:
+    """Query string temporal: startPeriod = max(inicio propio del dataset, YEAR_MIN),
+    endPeriod = YEAR_MAX si está definido; observaciones con todas las dimensiones."""
+    params = f"?startPeriod={max(start_period or YEAR_MIN, YEAR_MIN)}"
+    if YEAR_MAX is not None:
+        params += f"&endPeriod={YEAR_MAX}"
+    return params + "&dimensionAtObservation=AllDimensions"
+
+
+def _ref_area() -> str:
+    """Segmento REF_AREA de la clave: países del universo unidos con '+'.
+
+    La OCDE solo publica sus miembros y algunos socios, así que basta una
+    consulta; si la lista no deja margen en COUNTRY_URL_MAX se usa el segmento
+    vacío (todas las áreas) y `_to_long` filtra en cliente.
+    """
+    area = "+".join(country_universe.iso3_codes())
+    # Margen para base, dataflow, resto de la clave y parámetros temporales
+    if len(area) > country_universe.COUNTRY_URL_MAX - 400:
+        return ""
+    return area
+
+
+def _sha_url(units: str, categories: str) -> str:
+    """URL del dataset SHA para una o varias unidades/categorías (sintaxis OR '+')."""
+    # URL base para el dataset SHA (estructura fija en la instancia pública SDMX)
+    base_url = f"{SDMX_BASE_URL}/data/OECD.ELS.HD,DSD_SHA@DF_SHA,"
+
+    # Parámetros temporales: inicio de serie (2015, o YEAR_MIN si es posterior) y ventana global
+    time_params = _time_params(2015)
+
+    # Clave SDMX:
+    # Estructura (segmento relevante): {REF_AREA}.A.EXP_HEALTH.{UNIT}._T..{CAT|_T}.._T...
+    # Los '_T' representan agregaciones totales en otras dimensiones no usadas.
+    query_key = f"{_ref_area()}.A.EXP_HEALTH.{units}._T..{categories}.._T..."
+    return f"{base_url}/{query_key}{time_params}"
+
+
+def _probe_sha(
+    indicator_name: str,
+    um: str,
+    cat: Optional[str],
+    updated_after: Optional[datetime] = None,
+    stop: Optional[threading.Event] = None,
+) -> pd.DataFrame:
+    """Consulta una combinación (unidad, categoría) del dataset SHA; vacío si no hay datos.
+
+    Si `stop` está activado (ya hay ganadora) no se pide ni se decodifica nada.
+    """
+    if stop is not None and stop.is_set():
+        return empty_long()
+    url = _sha_url(um, cat if cat else "_T")
+    try:
+        fetched = _fetch_observations(url, updated_after)
+        if fetched is None or (stop is not None and stop.is_set()):
+            return empty_long()
+        _dims, decode = fetched
+        return _to_long(decode(["REF_AREA", "TIME_PERIOD"]), indicator_name)
+    except Exception as e:
+        # 429/5xx/red tras agotar reintentos: no significa "clave sin datos", se propaga
+        if http.is_transient(e):
+            raise
+        # Silencioso: se considera combinación sin datos; el logging final cubrirá el fallo global.
+        return empty_long()
+
 
 def fetch_sdmx_indicator(
     unit_measure: Union[str, List[str]],
     indicator_name: str,
     sha_category: Optional[Union[str, List[str]]] = None,
+    updated_after: Optional[datetime] = None,
 ) -> pd.DataFrame:
-    """Intenta combinaciones (unidad, categoría) hasta encontrar datos válidos."""
-    # URL base para el dataset SHA (estructura fija en la instancia pública SDMX)
-    base_url = "https://sdmx.oecd.org/public/rest/data/OECD.ELS.HD,DSD_SHA@DF_SHA,"
-
-    # Códigos de país válidos (solo aquellos cuyo valor es un código de 3 letras OECD)
-    oecd_country_codes = {k: v for k, v in COUNTRY_CODES.items() if len(v) == 3}
+    """Intenta combinaciones (unidad, categoría) hasta encontrar datos válidos.
 
-    # Mantener referencia: podría usarse en consultas específicas (no necesario en el patrón actual)
-    countries_param = "+".join(oecd_country_codes.values())  # Nota: reservado para filtros futuros
+    Si el memo local tiene una combinación ganadora de ejecuciones anteriores
+    se consulta directamente. Si no (o si ha dejado de devolver datos) todas
+    las combinaciones se lanzan en paralelo y gana la primera con datos en el
+    orden de la lista de fallback (como en serie); después se detienen las
+    demás (sin pedir ni decodificar más) y se memoriza la combinación.
 
-    # Parámetros temporales: inicio de serie y formato JSON SDMX "compact"
-    time_params = "?startPeriod=2015&dimensionAtObservation=AllDimensions&format=jsondata"
+    En modo incremental (`updated_after`) un resultado vacío significa "sin
+    cambios": no se re-prueban combinaciones ni se toca el memo.
 
+    Un fallo transitorio (429/5xx/red) no descarta la combinación: si ninguna
+    devuelve datos se registra el error y el memo se deja intacto.
+    """
     # Lista de fallback para unidades y categorías SHA
     unit_measures = [unit_measure] if isinstance(unit_measure, str) else list(unit_measure)
     sha_categories: List[Optional[str]] = (
         [sha_category] if isinstance(sha_category, str) else (list(sha_category) if sha_category else [None])
     )
-
-    # Probar todas las combinaciones hasta encontrar datos
-    for um in unit_measures:
-        for cat in sha_categories:
-            # Clave SDMX:
-            # Estructura (segmento relevante): .A.EXP_HEALTH.{UNIT}._T..{CAT|_T}.._T...
-            # Los '_T' representan agregaciones totales en otras dimensiones no usadas.
-            query_key = f".A.EXP_HEALTH.{um}._T..{(cat if cat else '_T')}.._T..."
-            url = f"{base_url}/{query_key}{time_params}"
-
-            try:
-                response = requests.get(url, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-
-                # Validación mínima de estructura SDMX
-                if "data" in data and "dataSets" in data["data"] and data["data"]["dataSets"]:
-                    dataset = data["data"]["dataSets"][0]
-                    structure = data["data"]["structures"][0]
-
-                    # Extraer dimensiones de interés (REF_AREA / TIME_PERIOD)
-                    ref_area_dim = None
-                    time_dimension = None
-                    for dim in structure["dimensions"]["observation"]:
-                        if dim["id"] == "REF_AREA":
-                            ref_area_dim = dim
-                        elif dim["id"] == "TIME_PERIOD":
-                            time_dimension = dim
-
-                    if ref_area_dim and time_dimension and "observations" in dataset:
-                        all_data = []
-                        code_to_name = {v: k for k, v in oecd_country_codes.items()}
-
-                        # Cada key es una tupla indexada en formato "i:j:k:...:t"
-                        for key, values in dataset["observations"].items():
-                            key_parts = key.split(":")
-                            # Asumimos REF_AREA está en la primera posición y TIME_PERIOD en la última
-                            ref_area_index = int(key_parts[0])
-                            time_index = int(key_parts[-1])
-
-                            # Validación de límites protectora
-                            if (ref_area_index < len(ref_area_dim["values"]) and
-                                    time_index < len(time_dimension["values"])):
-
-                                country_code = ref_area_dim["values"][ref_area_index]["id"]
-                                year = time_dimension["values"][time_index]["id"]
-                                value = values[0] if values and values[0] is not None else None
-
-                                # Solo conservar si hay valor y el país está mapeado
-                                if value is not None and country_code in code_to_name:
-                                    all_data.append({
-                                        "country": code_to_name[country_code],
-                                        "year": int(year),
-                                        "value": float(value),
-                                        "indicator": indicator_name
-                                    })
-
-                        # Retorno inmediato en la primera combinación exitosa
-                        if all_data:
-                            return pd.DataFrame(all_data)
-            except Exception:
-                # Silencioso: se intenta la siguiente combinación; el logging final cubrirá el fallo global.
-                continue
-    log.error("Error al obtener datos SDMX para %s", indicator_name)
-    return pd.DataFrame()
-
-
-def fetch_sdmx_health_expenditure() -> pd.DataFrame:
+    candidates = [(um, cat) for um in unit_measures for cat in sha_categories]
+
+    known = _memo_read().get(indicator_name)
+    if known and (known["unit_measure"], known["sha_category"]) in candidates:
+        combo = (known["unit_measure"], known["sha_category"])
+        try:
+            df = _probe_sha(indicator_name, *combo, updated_after)
+        except Exception as e:
+            log.error("Error transitorio al obtener datos SDMX para %s: %s", indicator_name, e)
+            return empty_long()
+        if not df.empty or updated_after is not None:
+            return df
+        log.info("SDMX %s: la clave memorizada %s ya no devuelve datos; se re-prueban combinaciones", indicator_name, combo)
+
+    df, winner, transient = empty_long(), None, None
+    if len(candidates) == 1:
+        try:
+            df = _probe_sha(indicator_name, *candidates[0], updated_after)
+        except Exception as e:
+            transient = e
+        winner = candidates[0] if not df.empty else None
+    else:
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=len(candidates))
+        futures = [
+            (combo, pool.submit(_probe_sha, indicator_name, *combo, updated_after, stop)) for combo in candidates
+        ]
+        try:
+            # Resultados en orden de prioridad: una combinación solo gana cuando
+            # todas las anteriores han fallado o vuelto vacías (mismo ganador
+            # que probándolas en serie, sin depender de qué respuesta llega antes).
+            for combo, fut in futures:
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    transient = e
+                    continue
+                if not res.empty:
+                    df, winner = res, combo
+                    break
+        finally:
+            # Las pendientes se cancelan y las que están en vuelo terminan sin
+            # decodificar; se esperan para no dejar peticiones ni conexiones
+            # ocupadas más allá de esta llamada.
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    if winner is None and transient is not None:
+        log.error("Error transitorio al obtener datos SDMX para %s: %s", indicator_name, transient)
+        return df
+    if winner is None and updated_after is not None:
+        log.info("SDMX %s: sin cambios desde %s", indicator_name, updated_after)
+        return df
+    _memo_update(indicator_name, winner)
+    if winner is None:
+        log.error("Error al obtener datos SDMX para %s", indicator_name)
+    return df
+
+
+def fetch_sdmx_health_expenditure(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto sanitario total como porcentaje del PIB (% PIB).
     Unidad: PT_B1GQ
     Indicador: health_expenditure_pct_gdp
     """
-    return fetch_sdmx_indicator("PT_B1GQ", "health_expenditure_pct_gdp")
+    return fetch_sdmx_indicator("PT_B1GQ", "health_expenditure_pct_gdp", updated_after=updated_after)
 
 
-def fetch_sdmx_health_expenditure_per_capita() -> pd.DataFrame:
+def fetch_sdmx_health_expenditure_per_capita(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto sanitario per cápita en euros PPP.
     Unidad: EUR_PPP_PS
     Indicador: health_expenditure_per_capita_eur_ppp
     """
-    return fetch_sdmx_indicator("EUR_PPP_PS", "health_expenditure_per_capita_eur_ppp")
+    return fetch_sdmx_indicator("EUR_PPP_PS", "health_expenditure_per_capita_eur_ppp", updated_after=updated_after)
 
 
-def fetch_sdmx_pharma_expenditure_per_capita() -> pd.DataFrame:
+def fetch_sdmx_pharma_expenditure_per_capita(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto farmacéutico per cápita (USD PPP).
     Unidad: USD_PPP_PS
@@ -129,10 +423,11 @@ def fetch_sdmx_pharma_expenditure_per_capita() -> pd.DataFrame:
         unit_measure=["USD_PPP_PS"],
         indicator_name="pharma_expenditure_per_capita_usd_ppp",
         sha_category=["HC51", "HC5_1", "HC.5.1"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_pharma_expenditure_pct_total() -> pd.DataFrame:
+def fetch_sdmx_pharma_expenditure_pct_total(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto farmacéutico como % del gasto sanitario corriente.
     Unidad: PT_EXP_HLTH
@@ -143,10 +438,11 @@ def fetch_sdmx_pharma_expenditure_pct_total() -> pd.DataFrame:
         unit_measure=["PT_EXP_HLTH"],
         indicator_name="pharma_expenditure_pct_total",
         sha_category=["HC51", "HC5_1", "HC.5.1"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_hospital_expenditure_pct_total() -> pd.DataFrame:
+def fetch_sdmx_hospital_expenditure_pct_total(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto hospitalario como % del gasto sanitario corriente.
     Unidad: PT_EXP_HLTH
@@ -157,10 +453,11 @@ def fetch_sdmx_hospital_expenditure_pct_total() -> pd.DataFrame:
         unit_measure=["PT_EXP_HLTH"],
         indicator_name="hospital_expenditure_pct_total",
         sha_category=["HC3", "HC.3"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_prevention_expenditure_pct_total() -> pd.DataFrame:
+def fetch_sdmx_prevention_expenditure_pct_total(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto en prevención como % del gasto sanitario corriente.
     Unidad: PT_EXP_HLTH
@@ -171,10 +468,11 @@ def fetch_sdmx_prevention_expenditure_pct_total() -> pd.DataFrame:
         unit_measure=["PT_EXP_HLTH"],
         indicator_name="prevention_expenditure_pct_total",
         sha_category=["HC6", "HC.6"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_obesity_or_overweight_population() -> pd.DataFrame:
+def fetch_sdmx_obesity_or_overweight_population(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Población con obesidad o sobrepeso (medido vs autodeclarado).
     Dataset: HEALTH_LVNG_BW
@@ -185,89 +483,37 @@ def fetch_sdmx_obesity_or_overweight_population() -> pd.DataFrame:
         - obesity_or_overweight_population_measured
         - obesity_or_overweight_population_self_reported
     """
-    base_url = "https://sdmx.oecd.org/public/rest/data/OECD.ELS.HD,DSD_HEALTH_LVNG@DF_HEALTH_LVNG_BW,"
-    query_key = ".A..._T..MSRD+SR"
-    time_params = "?startPeriod=2010&dimensionAtObservation=AllDimensions&format=jsondata"
+    base_url = f"{SDMX_BASE_URL}/data/OECD.ELS.HD,DSD_HEALTH_LVNG@DF_HEALTH_LVNG_BW,"
+    query_key = f"{_ref_area()}.A..._T..MSRD+SR"
+    time_params = _time_params(2010)
     url = f"{base_url}/{query_key}{time_params}"
 
-    # Filtro de países (códigos de 3 letras)
-    oecd_country_codes = {k: v for k, v in COUNTRY_CODES.items() if len(v) == 3}
-    code_to_name = {v: k for k, v in oecd_country_codes.items()}
-
     try:
-        resp = requests.get(url, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-
-        if "data" not in data or "dataSets" not in data["data"] or not data["data"]["dataSets"]:
-            return pd.DataFrame()
-
-        dataset = data["data"]["dataSets"][0]
-        structure = data["data"]["structures"][0]
-        obs_dims = structure["dimensions"]["observation"]
-
-        # Localiza posiciones para REF_AREA, TIME_PERIOD y la dimensión con MSRD/SR.
-        ref_area_pos = time_pos = None
-        meas_pos = None
-        ref_area_dim = time_dim = meas_dim = None
-
-        for i, dim in enumerate(obs_dims):
-            if dim["id"] == "REF_AREA":
-                ref_area_pos, ref_area_dim = i, dim
-            elif dim["id"] == "TIME_PERIOD":
-                time_pos, time_dim = i, dim
-            else:
-                # Heurística: tomar la primera dimensión que incluya MSRD o SR
-                ids = {v.get("id") for v in dim.get("values", [])}
-                if "MSRD" in ids or "SR" in ids:
-                    meas_pos, meas_dim = i, dim
-
-        if ref_area_pos is None or time_pos is None or "observations" not in dataset:
-            return pd.DataFrame()
-
-        all_rows: List[dict] = []
-        for key, values in dataset["observations"].items():
-            parts = key.split(":")
-            try:
-                ra_idx = int(parts[ref_area_pos])
-                t_idx = int(parts[time_pos])
-                meas_code = None
-                if meas_pos is not None:
-                    m_idx = int(parts[meas_pos])
-                    if m_idx < len(meas_dim["values"]):
-                        meas_code = meas_dim["values"][m_idx]["id"]
-            except Exception:
-                continue
-
-            if ra_idx >= len(ref_area_dim["values"]) or t_idx >= len(time_dim["values"]):
-                continue
-
-            country_code = ref_area_dim["values"][ra_idx]["id"]
-            if country_code not in code_to_name:
-                continue
-
-            year = time_dim["values"][t_idx]["id"]
-            val = values[0] if values and values[0] is not None else None
-            if val is None:
-                continue
-
-            kind = "measured" if meas_code == "MSRD" else ("self_reported" if meas_code == "SR" else (meas_code.lower() if meas_code else "unknown"))
-            indicator = f"obesity_or_overweight_population_{kind}"
-
-            all_rows.append({
-                "country": code_to_name[country_code],
-                "year": int(year),
-                "value": float(val),
-                "indicator": indicator
-            })
-
-        return pd.DataFrame(all_rows)
+        fetched = _fetch_observations(url, updated_after)
+        if fetched is None:
+            return empty_long()
+        dims, decode = fetched
+
+        # Heurística: tomar la dimensión (distinta de REF_AREA/TIME_PERIOD) que incluya MSRD o SR
+        meas_id = None
+        for dim_id, codes in dims.items():
+            if dim_id not in ("REF_AREA", "TIME_PERIOD") and ("MSRD" in codes or "SR" in codes):
+                meas_id = dim_id
+
+        dim_ids = ["REF_AREA", "TIME_PERIOD"] + ([meas_id] if meas_id else [])
+        obs = decode(dim_ids)
+        meas = obs[meas_id] if meas_id else pd.Series(None, index=obs.index, dtype=object)
+
+        kind = meas.map(
+            lambda c: "measured" if c == "MSRD" else ("self_reported" if c == "SR" else (c.lower() if c else "unknown"))
+        )
+        return _to_long(obs, "obesity_or_overweight_population_" + kind.astype(str))
     except Exception:
         log.error("Error al obtener datos SDMX para obesity_or_overweight_population")
-        return pd.DataFrame()
+        return empty_long()
 
 
-def fetch_sdmx_hospital_expenditure_per_capita() -> pd.DataFrame:
+def fetch_sdmx_hospital_expenditure_per_capita(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto hospitalario per cápita (USD PPP).
     Unidad: USD_PPP_PS
@@ -278,10 +524,11 @@ def fetch_sdmx_hospital_expenditure_per_capita() -> pd.DataFrame:
         unit_measure=["USD_PPP_PS"],
         indicator_name="hospital_expenditure_per_capita_usd_ppp",
         sha_category=["HC3", "HC.3"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_pharma_expenditure_pct_gdp() -> pd.DataFrame:
+def fetch_sdmx_pharma_expenditure_pct_gdp(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto farmacéutico como % del PIB.
     Unidad: PT_B1GQ
@@ -292,10 +539,11 @@ def fetch_sdmx_pharma_expenditure_pct_gdp() -> pd.DataFrame:
         unit_measure=["PT_B1GQ"],
         indicator_name="pharma_expenditure_pct_gdp",
         sha_category=["HC51", "HC5_1", "HC.5.1"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_hospital_expenditure_pct_gdp() -> pd.DataFrame:
+def fetch_sdmx_hospital_expenditure_pct_gdp(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     Gasto hospitalario como % del PIB.
     Unidad: PT_B1GQ
@@ -306,10 +554,11 @@ def fetch_sdmx_hospital_expenditure_pct_gdp() -> pd.DataFrame:
         unit_measure=["PT_B1GQ"],
         indicator_name="hospital_expenditure_pct_gdp",
         sha_category=["HC3", "HC.3"],
+        updated_after=updated_after,
     )
 
 
-def fetch_sdmx_ptr_aw67() -> pd.DataFrame:
+def fetch_sdmx_ptr_aw67(updated_after: Optional[datetime] = None) -> pd.DataFrame:
     """
     PTR (Participation Tax Rate) seleccionado para AW67 y total (_Z).
     Dataset: TAXBEN PTR (DF_PTRUB)
@@ -318,127 +567,160 @@ def fetch_sdmx_ptr_aw67() -> pd.DataFrame:
         - ptr_total  : Código _Z
         - ptr_other  : Otros (fallback defensivo)
     """
-    base_url = "https://sdmx.oecd.org/public/rest/data/OECD.ELS.JAI,DSD_TAXBEN_PTR@DF_PTRUB,1.0"
-    query_key = "...AW67.C_C2..AW67+_Z..M2.YES.NO.NO...A"
-    params = "?dimensionAtObservation=AllDimensions&format=jsondata"
+    base_url = f"{SDMX_BASE_URL}/data/OECD.ELS.JAI,DSD_TAXBEN_PTR@DF_PTRUB,1.0"
+    query_key = f"{_ref_area()}...AW67.C_C2..AW67+_Z..M2.YES.NO.NO...A"
+    params = _time_params()
     url = f"{base_url}/{query_key}{params}"
 
-    # Filtro de países (códigos de 3 letras)
-    oecd_country_codes = {k: v for k, v in COUNTRY_CODES.items() if len(v) == 3}
-    code_to_name = {v: k for k, v in oecd_country_codes.items()}
-
     try:
-        resp = requests.get(url, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-
-        if "data" not in data or "dataSets" not in data["data"] or not data["data"]["dataSets"]:
-            return pd.DataFrame()
-
-        dataset = data["data"]["dataSets"][0]
-        structure = data["data"]["structures"][0]
-        obs_dims = structure["dimensions"]["observation"]
-
-        # Buscar índices de dimensión
-        ref_area_pos = time_pos = None
-        ref_area_dim = time_dim = None
+        fetched = _fetch_observations(url, updated_after)
+        if fetched is None:
+            return empty_long()
+        dims, decode = fetched
 
         # Buscar la dimensión que contiene AW67/_Z para etiquetar
-        grp_pos = None
-        grp_dim = None
-        for i, dim in enumerate(obs_dims):
-            if dim["id"] == "REF_AREA":
-                ref_area_pos, ref_area_dim = i, dim
-            elif dim["id"] == "TIME_PERIOD":
-                time_pos, time_dim = i, dim
-
-        # Elegir la dimensión que tenga ambos códigos si es posible
         candidates: List[tuple] = []
-        for i, dim in enumerate(obs_dims):
-            ids = {v.get("id") for v in dim.get("values", [])}
+        for dim_id, codes in dims.items():
+            ids = set(codes)
             if "AW67" in ids or "_Z" in ids:
-                candidates.append((i, dim, ids))
+                candidates.append((dim_id, ids))
         # Preferir la que contenga ambos códigos
-        for i, dim, ids in candidates:
-            if "AW67" in ids and "_Z" in ids:
-                grp_pos, grp_dim = i, dim
-                break
-        if grp_pos is None and candidates:
-            grp_pos, grp_dim, _ = candidates[0]
-
-        if ref_area_pos is None or time_pos is None or "observations" not in dataset:
-            return pd.DataFrame()
-
-        rows: List[dict] = []
-        for key, values in dataset["observations"].items():
-            parts = key.split(":")
-            try:
-                ra_idx = int(parts[ref_area_pos])
-                t_idx = int(parts[time_pos])
-            except Exception:
-                continue
-
-            if ra_idx >= len(ref_area_dim["values"]) or t_idx >= len(time_dim["values"]):
-                continue
-
-            country_code = ref_area_dim["values"][ra_idx]["id"]
-            if country_code not in code_to_name:
-                continue
-
-            gcode = None
-            if grp_pos is not None:
-                try:
-                    g_idx = int(parts[grp_pos])
-                    if g_idx < len(grp_dim["values"]):
-                        gcode = grp_dim["values"][g_idx]["id"]
-                except Exception:
-                    pass
-
-            val = values[0] if values and values[0] is not None else None
-            if val is None:
-                continue
-
-            indicator = "ptr_aw67" if gcode == "AW67" else ("ptr_total" if gcode == "_Z" else "ptr_other")
-
-            rows.append({
-                "country": code_to_name[country_code],
-                "year": int(time_dim["values"][t_idx]["id"]),
-                "value": float(val),
-                "indicator": indicator
-            })
-
-        return pd.DataFrame(rows)
+        grp_id = next((d for d, ids in candidates if "AW67" in ids and "_Z" in ids), None)
+        if grp_id is None and candidates:
+            grp_id = candidates[0][0]
+
+        dim_ids = ["REF_AREA", "TIME_PERIOD"] + ([grp_id] if grp_id else [])
+        obs = decode(dim_ids)
+        gcode = obs[grp_id] if grp_id else pd.Series(None, index=obs.index, dtype=object)
+
+        indicator = gcode.map(lambda g: "ptr_aw67" if g == "AW67" else ("ptr_total" if g == "_Z" else "ptr_other"))
+        return _to_long(obs, indicator)
     except Exception:
         log.error("Error al obtener datos SDMX para PTR (AW67)")
-        return pd.DataFrame()
+        return empty_long()
+
+
+# Orden de extracción (y de concatenación) de los indicadores SDMX
+FETCHERS = [
+    fetch_sdmx_health_expenditure,
+    fetch_sdmx_health_expenditure_per_capita,
+    fetch_sdmx_pharma_expenditure_per_capita,
+    fetch_sdmx_pharma_expenditure_pct_total,
+    fetch_sdmx_hospital_expenditure_pct_total,
+    fetch_sdmx_prevention_expenditure_pct_total,
+    fetch_sdmx_obesity_or_overweight_population,
+    fetch_sdmx_hospital_expenditure_per_capita,
+    fetch_sdmx_pharma_expenditure_pct_gdp,
+    fetch_sdmx_hospital_expenditure_pct_gdp,
+    fetch_sdmx_ptr_aw67,
+]
+
+# Indicadores del dataflow SHA: (fetcher individual, unidad, categorías fallback).
+# Deben coincidir con las llamadas a fetch_sdmx_indicator de cada fetcher.
+SHA_INDICATORS = {
+    "health_expenditure_pct_gdp": (fetch_sdmx_health_expenditure, "PT_B1GQ", [None]),
+    "health_expenditure_per_capita_eur_ppp": (fetch_sdmx_health_expenditure_per_capita, "EUR_PPP_PS", [None]),
+    "pharma_expenditure_per_capita_usd_ppp": (fetch_sdmx_pharma_expenditure_per_capita, "USD_PPP_PS", ["HC51", "HC5_1", "HC.5.1"]),
+    "pharma_expenditure_pct_total": (fetch_sdmx_pharma_expenditure_pct_total, "PT_EXP_HLTH", ["HC51", "HC5_1", "HC.5.1"]),
+    "hospital_expenditure_pct_total": (fetch_sdmx_hospital_expenditure_pct_total, "PT_EXP_HLTH", ["HC3", "HC.3"]),
+    "prevention_expenditure_pct_total": (fetch_sdmx_prevention_expenditure_pct_total, "PT_EXP_HLTH", ["HC6", "HC.6"]),
+    "hospital_expenditure_per_capita_usd_ppp": (fetch_sdmx_hospital_expenditure_per_capita, "USD_PPP_PS", ["HC3", "HC.3"]),
+    "pharma_expenditure_pct_gdp": (fetch_sdmx_pharma_expenditure_pct_gdp, "PT_B1GQ", ["HC51", "HC5_1", "HC.5.1"]),
+    "hospital_expenditure_pct_gdp": (fetch_sdmx_hospital_expenditure_pct_gdp, "PT_B1GQ", ["HC3", "HC.3"]),
+}
+
+# Modo por lotes: todo SHA en una consulta con sintaxis OR (opt-in)
+SDMX_BATCH = os.getenv("SDMX_BATCH", "0") == "1"
+
+
+def fetch_sdmx_sha_batch(updated_after: Optional[datetime] = None) -> pd.DataFrame:
+    """Descarga todos los indicadores SHA en una única consulta y los demultiplexa.
+
+    Pide la unión de unidades y categorías (p.ej. PT_B1GQ+EUR_PPP_PS+... y
+    HC51+HC3+HC6+_T); para cada categoría se usa la ganadora del memo si la
+    hay y, si no, la primera de su lista de fallback. Las observaciones se
+    reparten por (UNIT_MEASURE, FUNCTION) entre los nombres de indicador. Los
+    indicadores que queden sin filas se piden por la vía individual (salvo en
+    modo incremental, donde sin filas significa sin cambios).
+    """
+    memo = _memo_read()
+    wanted = {}
+    for name, (_fetch, um, cats) in SHA_INDICATORS.items():
+        known = memo.get(name)
+        cat = known["sha_category"] if known and known["sha_category"] in cats else cats[0]
+        wanted[name] = (um, cat if cat else "_T")
 
+    units = "+".join(dict.fromkeys(um for um, _ in wanted.values()))
+    categories = "+".join(dict.fromkeys(cat for _, cat in wanted.values()))
 
-def get_health_expenditure_data() -> pd.DataFrame:
-    """Ejecuta todas las funciones fetch_* y une resultados no vacíos."""
-    log.info("Extracción SDMX: obteniendo indicadores de salud")
-    indicators = [
-        fetch_sdmx_health_expenditure(),
-        fetch_sdmx_health_expenditure_per_capita(),
-        fetch_sdmx_pharma_expenditure_per_capita(),
-        fetch_sdmx_pharma_expenditure_pct_total(),
-        fetch_sdmx_hospital_expenditure_pct_total(),
-        fetch_sdmx_prevention_expenditure_pct_total(),
-        fetch_sdmx_obesity_or_overweight_population(),
-        fetch_sdmx_hospital_expenditure_per_capita(),
-        fetch_sdmx_pharma_expenditure_pct_gdp(),
-        fetch_sdmx_hospital_expenditure_pct_gdp(),
-        fetch_sdmx_ptr_aw67(),
-    ]
-
-    # Filtrar DataFrames vacíos y concatenar
+    frames, batch_ok = {}, False
+    try:
+        fetched = _fetch_observations(_sha_url(units, categories), updated_after)
+        batch_ok = True
+        if fetched is not None:
+            dims, decode = fetched
+            # Posición en la clave SHA: UNIT_MEASURE = 4ª dimensión, FUNCTION = 7ª
+            ids = list(dims)
+            unit_id = "UNIT_MEASURE" if "UNIT_MEASURE" in ids else ids[3]
+            func_id = "FUNCTION" if "FUNCTION" in ids else ids[6]
+            obs = decode(["REF_AREA", "TIME_PERIOD", unit_id, func_id])
+            for name, (um, cat) in wanted.items():
+                frames[name] = _to_long(obs[(obs[unit_id] == um) & (obs[func_id] == cat)], name)
+    except Exception as e:
+        log.warning("Consulta SHA por lotes fallida (%s); se usa la vía individual", e)
+
+    out = []
+    for name, (fetch, _um, _cats) in SHA_INDICATORS.items():
+        df = frames.get(name, empty_long())
+        if df.empty and not (batch_ok and updated_after is not None):
+            df = fetch(updated_after)
+        if not df.empty:
+            out.append(df)
+    return pd.concat(out, ignore_index=True) if out else empty_long()
+
+
+# Indicadores que genera cada fetcher que no pertenece al dataflow SHA
+OTHER_INDICATORS = {
+    fetch_sdmx_obesity_or_overweight_population: [
+        "obesity_or_overweight_population_measured",
+        "obesity_or_overweight_population_self_reported",
+    ],
+    fetch_sdmx_ptr_aw67: ["ptr_aw67", "ptr_total"],
+}
+
+
+def extraction_tasks(since: Optional[dict[str, Watermark]] = None) -> list:
+    """Descargas (función, args) a ejecutar en orden según el modo configurado.
+
+    Con marcas de agua (`since`) cada fetcher recibe `updatedAfter` = la marca
+    más antigua de los indicadores que produce (None → histórico completo).
+    """
+    produced = {fetch: [name] for name, (fetch, _um, _cats) in SHA_INDICATORS.items()}
+    produced.update(OTHER_INDICATORS)
+    tasks = [(fetch, (_updated_after(since, produced.get(fetch, [])),)) for fetch in FETCHERS]
+    if SDMX_BATCH:
+        sha = {fetch for fetch, _um, _cats in SHA_INDICATORS.values()}
+        batch = (fetch_sdmx_sha_batch, (_updated_after(since, SHA_INDICATORS),))
+        return [batch] + [t for t in tasks if t[0] not in sha]
+    return tasks
+
+
+def _combine(indicators: List[pd.DataFrame]) -> pd.DataFrame:
+    """Filtra DataFrames vacíos, concatena y compacta tipos (utils.long_frame)."""
     valid_indicators = [df for df in indicators if not df.empty]
     if valid_indicators:
-        out = pd.concat(valid_indicators, ignore_index=True)
+        out = compact_long(pd.concat(valid_indicators, ignore_index=True))
         log.info("Extracción SDMX: %s filas (%s indicadores)", len(out), out["indicator"].nunique())
         return out
     else:
         log.warning("Extracción SDMX vacía (0 filas)")
-        return pd.DataFrame()
+        return empty_long()
+
+
+def get_health_expenditure_data(since: Optional[dict[str, Watermark]] = None) -> pd.DataFrame:
+    """Ejecuta todas las funciones fetch_* y une resultados no vacíos."""
+    log.info("Extracción SDMX: obteniendo indicadores de salud")
+    return _combine([fetch(*args) for fetch, args in extraction_tasks(since)])
 
 
 if __name__ == "__main__":
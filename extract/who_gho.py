@@ -1,12 +1,24 @@
 # /extract/who_gho.py
+import os
+from array import array
+from typing import Iterable, Iterator
+from urllib.parse import quote, urlencode
+import numpy as np
 import requests
 import pandas as pd
-from extract.constants import COUNTRY_CODES
+import pyarrow as pa
+from extract import countries as country_universe
+from utils import http
+from utils.json_stream import iter_array_items
+from utils.config import YEAR_MIN, YEAR_MAX
+from utils.watermark import Watermark, start_year
 from utils.logging import get_logger
+from utils.long_frame import ARROW_BACKEND, compact_long, empty_long
 
 log = get_logger(__name__)
 
-GHO_BASE = "https://ghoapi.azureedge.net/api"
+# URL base de la API (configurable para apuntar a un servidor local, p.ej. bench/stubs.py)
+GHO_BASE = os.getenv("GHO_BASE_URL", "https://ghoapi.azureedge.net/api").rstrip("/")
 
 
 INDICATORS = {
@@ -21,69 +33,132 @@ INDICATORS = {
     "oop_share_che": "GHED_OOPSCHE_SHA2011",
 }
 
-def _get(url: str) -> dict:
-    r = requests.get(url, timeout=60)
-    r.raise_for_status()
-    return r.json()
-
-def _fetch_indicator(indicator_code: str, country_codes: list[str]) -> pd.DataFrame:
-    url = f"{GHO_BASE}/{indicator_code}"
-    data = _get(url).get("value", [])
-    if not data:
-        return pd.DataFrame(columns=["country", "year", "value"])
-
-    df = pd.DataFrame(data)
-
-    # Columnas típicas y alternativas en GHO
-    col_country = "SpatialDim" if "SpatialDim" in df.columns else ("SpatialDimKey" if "SpatialDimKey" in df.columns else None)
-    col_year    = "TimeDim"    if "TimeDim"    in df.columns else ("TimeDimKey"    if "TimeDimKey"    in df.columns else None)
-    col_value   = "NumericValue" if "NumericValue" in df.columns else ("Value" if "Value" in df.columns else None)
-
-    if not all([col_country, col_year, col_value]):
-        return pd.DataFrame(columns=["country", "year", "value"])
-
-    # Filtrar países
-    df = df[df[col_country].isin(country_codes)].copy()
-
-    # Normalizar nombres
-    df.rename(columns={col_country: "country", col_year: "year", col_value: "value"}, inplace=True)
-
-    # Tipos
-    df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
-    df["value"] = pd.to_numeric(df["value"], errors="coerce")
-
-    # Salida mínima
-    return df.dropna(subset=["year", "value"])[["country", "year", "value"]]
-
-def get_diabetes_obesity_data() -> pd.DataFrame:
-    """Concatena indicadores WHO definidos y devuelve formato largo estándar."""
-    frames = []
-    countries = list(COUNTRY_CODES.values())
-    log.info("Extracción WHO: %d indicadores", len(INDICATORS))
-
-    for name, code in INDICATORS.items():
+def _get_stream(url: str) -> Iterator[bytes]:
+    """Trozos de bytes de la respuesta (lanza HTTPError antes de iterar).
+
+    Descarga en streaming real también con caché HTTP activa: el cuerpo se
+    guarda en la caché y en landing según llega, y una entrada vigente se lee
+    de disco por trozos (`http.iter_body`).
+    """
+    return http.iter_body(url, chunk_size=1 << 16)
+
+def _odata_query(country_codes: list[str], year_min: int, year_max: int | None = YEAR_MAX) -> str:
+    """$filter (países + ventana de años) y $select (3 columnas) para la API OData de GHO."""
+    countries = " or ".join(f"SpatialDim eq '{c}'" for c in country_codes)
+    years = f"TimeDim ge {year_min}" + (f" and TimeDim le {year_max}" if year_max is not None else "")
+    params = {
+        "$filter": f"({countries}) and {years}",
+        "$select": "SpatialDim,TimeDim,NumericValue",
+    }
+    return "?" + urlencode(params, quote_via=quote, safe="$,'")
+
+def _parse_stream(
+    chunks: Iterable[bytes], country_codes: list[str], year_min: int, year_max: int | None = YEAR_MAX
+) -> pd.DataFrame:
+    """Parseo incremental del array `value` reteniendo solo país/año/valor.
+
+    Cada registro GHO (~25 campos) se descarta en cuanto se leen sus tres
+    campos útiles; las filas retenidas se acumulan en arrays tipados, así que
+    la memoria depende de las filas conservadas y no del tamaño del payload.
+    """
+    wanted = set(country_codes)
+    countries: list[str] = []
+    years = array("q")
+    values = array("d")
+
+    chunks = iter(chunks)
+    for rec in iter_array_items(chunks, "value"):
+        country = rec.get("SpatialDim", rec.get("SpatialDimKey"))
+        if country not in wanted:
+            continue
         try:
-            dfi = _fetch_indicator(code, countries)
-            if dfi.empty:
-                log.info("Sin filas WHO para %s (%s)", name, code)
-                continue
-            dfi["indicator"] = name
-            frames.append(dfi)
-        except requests.HTTPError as e:
-            log.error("Error HTTP %s: %s", code, e)
-        except Exception as e:
-            log.error("Error general %s: %s", code, e)
-
+            year = int(rec.get("TimeDim", rec.get("TimeDimKey")))
+            value = float(rec["NumericValue"] if "NumericValue" in rec else rec.get("Value"))
+        except (TypeError, ValueError):
+            continue
+        if year < year_min or (year_max is not None and year > year_max) or value != value:  # NaN
+            continue
+        countries.append(country)
+        years.append(year)
+        values.append(value)
+    for _ in chunks:  # resto del documento tras el array: completa caché/landing y libera la conexión
+        pass
+
+    if ARROW_BACKEND:
+        # Columnas Arrow sobre los mismos buffers tipados (texto en un único buffer Arrow)
+        return pa.table({
+            "country": pa.array(countries, pa.string()),
+            "year": pa.array(np.frombuffer(years, dtype=np.int64) if years else [], pa.int64()).cast(pa.int16()),
+            "value": pa.array(np.frombuffer(values, dtype=np.float64) if values else [], pa.float64()),
+        }).to_pandas(types_mapper=pd.ArrowDtype)
+    return pd.DataFrame({
+        "country": countries,
+        "year": pd.array(np.frombuffer(years, dtype=np.int64) if years else [], dtype="Int64"),
+        "value": np.frombuffer(values, dtype=np.float64) if values else np.array([], dtype=np.float64),
+    })
+
+def _fetch_indicator(indicator_code: str, country_codes: list[str], year_min: int = YEAR_MIN) -> pd.DataFrame:
+    url = f"{GHO_BASE}/{indicator_code}"
+    # Filtro y proyección en servidor, con los países repartidos en grupos cuya
+    # URL cabe en COUNTRY_URL_MAX (en paralelo); si la API rechaza la consulta
+    # (4xx no transitorio) se descarga el indicador completo y se filtra en cliente (mismo resultado).
+    groups = country_universe.chunk_codes(country_codes, lambda codes: url + _odata_query(codes, year_min))
+
+    def _fetch_group(codes: list[str]) -> pd.DataFrame:
+        return _parse_stream(_get_stream(url + _odata_query(codes, year_min)), codes, year_min)
+
+    try:
+        frames = country_universe.map_chunks(_fetch_group, groups)
+    except requests.HTTPError as e:
+        # 429/5xx ya reintentados: no es un rechazo de la consulta y bajar el
+        # indicador completo cargaría más a un servidor saturado → se propaga
+        if http.is_transient(e):
+            raise
+        log.warning("GHO rechaza $filter/$select para %s (%s); filtrado en cliente", indicator_code, e)
+        return _parse_stream(_get_stream(url), country_codes, year_min)
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+def _fetch_named(name: str, code: str, country_codes: list[str], year_min: int = YEAR_MIN) -> pd.DataFrame | None:
+    """Descarga un indicador y le asigna su nombre interno; None si falla o viene vacío."""
+    try:
+        dfi = _fetch_indicator(code, country_codes, year_min)
+        if dfi.empty:
+            log.info("Sin filas WHO para %s (%s)", name, code)
+            return None
+        dfi["indicator"] = name
+        return dfi
+    except requests.HTTPError as e:
+        log.error("Error HTTP %s: %s", code, e)
+    except Exception as e:
+        log.error("Error general %s: %s", code, e)
+    return None
+
+def _combine(frames: list[pd.DataFrame | None]) -> pd.DataFrame:
+    """Une los indicadores descargados, mapea ISO3 → nombre, ordena y compacta tipos."""
+    frames = [f for f in frames if f is not None]
     if not frames:
-        return pd.DataFrame(columns=["country", "year", "indicator", "value"])
+        return empty_long()
 
     df = pd.concat(frames, ignore_index=True)
 
-    # Mapear código WHO → nombre de país (COUNTRY_CODES: {"Spain":"ESP",...})
-    code_to_name = {v: k for k, v in COUNTRY_CODES.items()}
-    df["country"] = df["country"].map(code_to_name).fillna(df["country"]).astype("string")
+    # Mapear código WHO → nombre de país (universo: {"Spain":"ESP",...})
+    code_to_name = country_universe.code_to_name()
+    df["country"] = df["country"].map(code_to_name).fillna(df["country"])
 
     # Orden estable
-    out = df[["country", "year", "indicator", "value"]].sort_values(["indicator", "country", "year"]).reset_index(drop=True)
+    out = compact_long(df.sort_values(["indicator", "country", "year"]))
     log.info("Extracción WHO: %s filas", len(out))
     return out
+
+def extraction_tasks(since: dict[str, Watermark] | None = None) -> list:
+    """Descargas (función, args) por indicador; con marcas de agua, TimeDim desde el delta."""
+    countries = country_universe.iso3_codes()
+    return [
+        (_fetch_named, (name, code, countries, start_year(since, name, YEAR_MIN)))
+        for name, code in INDICATORS.items()
+    ]
+
+def get_diabetes_obesity_data(since: dict[str, Watermark] | None = None) -> pd.DataFrame:
+    """Concatena indicadores WHO definidos y devuelve formato largo estándar."""
+    log.info("Extracción WHO: %d indicadores", len(INDICATORS))
+    return _combine([fn(*args) for fn, args in extraction_tasks(since)])
@@ -1,111 +1,341 @@
-import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import pandas as pd
-from extract.constants import COUNTRY_CODES
+import pyarrow as pa
+from extract import countries as country_universe
+from utils import http
+from utils.config import YEAR_MIN, YEAR_MAX
+from utils.watermark import Watermark, start_year as _start_year
 from utils.logging import get_logger
+from utils.long_frame import ARROW_BACKEND, arrow_long, compact_long, empty_long, numeric_arrow
 
 log = get_logger(__name__)
 
-def fetch_world_bank_indicator(indicator_code: str, indicator_name: str):
-    """Descarga un indicador (todas las páginas) y normaliza columnas."""
-    start_year = 1960
-    end_year = 2024
-    countries = ";".join(COUNTRY_CODES.values())
-    
+# Concurrencia acotada: nº de indicadores en paralelo y de páginas en paralelo por indicador.
+# WB_MAX_WORKERS=1 reproduce el recorrido secuencial original.
+WB_MAX_WORKERS = max(1, int(os.getenv("WB_MAX_WORKERS", "4")))
+WB_PAGE_WORKERS = max(1, int(os.getenv("WB_PAGE_WORKERS", "4")))
+# Rondas extra para las páginas que siguen fallando tras los reintentos de utils.http
+WB_PAGE_RETRY_ROUNDS = max(0, int(os.getenv("WB_PAGE_RETRY_ROUNDS", "2")))
+
+INDICATORS = [
+    # Demografía de población (existente)
+    ("SP.POP.TOTL", "population"),
+    ("SP.RUR.TOTL.ZS", "rural_population_pct"),
+    ("SP.POP.1564.TO.ZS", "population_15_64_pct"),
+    ("SP.POP.65UP.TO.ZS", "population_65_plus_pct"),
+
+    # Salud y carga epidemiológica
+    ("SP.DYN.LE00.IN", "life_expectancy_total"),
+    ("SP.DYN.LE00.FE.IN", "life_expectancy_female"),
+    ("SP.DYN.LE00.MA.IN", "life_expectancy_male"),
+    ("SH.DYN.MORT", "under5_mortality_rate"),
+    ("SH.STA.MALN.ZS", "malnutrition_prevalence_under5"),
+    ("SH.STA.DIAB.ZS", "diabetes_prevalence_20_79"),
+    ("SH.STA.OWGH.ZS", "overweight_prevalence_under5"),
+
+    # Economía y gasto sanitario
+    ("NY.GDP.MKTP.CD", "gdp_usd"),
+    ("NY.GDP.PCAP.CD", "gdp_per_capita_usd"),
+    ("SH.XPD.CHEX.GD.ZS", "health_expenditure_pct_gdp"),
+    ("SH.XPD.CHEX.PC.CD", "health_expenditure_per_capita_usd"),
+
+    # Factores socioeconómicos
+    ("SI.POV.GINI", "gini_index"),
+    ("SI.POV.LMIC.GP", "poverty_headcount_320_day"),
+    ("SE.ADT.LITR.ZS", "adult_literacy_rate"),
+    ("SL.UEM.TOTL.ZS", "unemployment_rate")
+]
+
+# Modo por lotes: varios indicadores de una misma fuente WB en cada llamada paginada
+WB_BATCH = os.getenv("WB_BATCH", "0") == "1"
+WB_BATCH_SIZE = max(1, int(os.getenv("WB_BATCH_SIZE", "20")))
+
+# Fuente WB de cada indicador (la API solo admite listas ';' dentro de una fuente).
+# Por defecto World Development Indicators (source=2).
+WDI_SOURCE = 2
+INDICATOR_SOURCES: dict[str, int] = {}
+
+# URL base de la API (configurable para apuntar a un servidor local, p.ej. bench/stubs.py)
+WB_BASE_URL = os.getenv("WB_BASE_URL", "https://api.worldbank.org/v2").rstrip("/")
+
+# Ventana de años pedida a la API (extracción sin marca de agua): la API
+# empieza en 1960; YEAR_MIN / YEAR_MAX recortan en origen. Sin YEAR_MAX se pide
+# hasta el año en curso, así que los años nuevos entran sin tocar la configuración.
+WB_START_YEAR = max(1960, YEAR_MIN)
+WB_END_YEAR = YEAR_MAX if YEAR_MAX is not None else datetime.now(timezone.utc).year
+
+def _page_url(
+    indicator_code: str, page: int, source: int | None, start_year: int, countries: list[str]
+) -> str:
+    end_year = WB_END_YEAR
     per_page = 1000
-    page = 1
-    all_records = []
+    url = (
+        f"{WB_BASE_URL}/country/{';'.join(countries)}/indicator/{indicator_code}"
+        f"?format=json&date={start_year}:{end_year}&per_page={per_page}&page={page}"
+    )
+    if source is not None:
+        url += f"&source={source}"
+    return url
 
-    while True:
-        url = (
-            f"https://api.worldbank.org/v2/country/{countries}/indicator/{indicator_code}"
-            f"?format=json&date={start_year}:{end_year}&per_page={per_page}&page={page}"
-        )
-        response = requests.get(url)
-        response.raise_for_status()
-        json_data = response.json()
+def _fetch_page(
+    indicator_code: str,
+    page: int,
+    source: int | None = None,
+    start_year: int = WB_START_YEAR,
+    countries: list[str] | None = None,
+) -> list:
+    """Descarga una página del indicador (o lista 'A;B;C'); devuelve [meta, rows] tal cual la API."""
+    countries = countries or country_universe.iso3_codes()
+    return http.get_json(_page_url(indicator_code, page, source, start_year, countries))
 
-        if len(json_data) < 2 or not json_data[1]:
-            break
+def _country_chunks(indicator_code: str, source: int | None, start_year: int) -> list[list[str]]:
+    """Universo de países troceado para que la URL de cada consulta quepa en COUNTRY_URL_MAX."""
+    # Página de 5 cifras como cota: la URL real nunca es más larga
+    return country_universe.chunk_codes(
+        country_universe.iso3_codes(),
+        lambda chunk: _page_url(indicator_code, 10_000, source, start_year, chunk),
+    )
 
-        all_records.extend(json_data[1])
+def _fetch_records(
+    indicator_code: str,
+    source: int | None = None,
+    page_workers: int | None = None,
+    start_year: int = WB_START_YEAR,
+) -> list:
+    """Todas las filas de la consulta para el universo de países.
+
+    Si la lista de países no cabe en una URL se trocea; los trozos se
+    descargan en paralelo y sus filas se concatenan en el orden de los trozos.
+    """
+    chunks = _country_chunks(indicator_code, source, start_year)
+    if len(chunks) == 1:
+        return _fetch_chunk_records(indicator_code, source, page_workers, start_year, chunks[0])
+    log.debug("%s: %d trozos de países", indicator_code, len(chunks))
+    parts = country_universe.map_chunks(
+        lambda chunk: _fetch_chunk_records(indicator_code, source, page_workers, start_year, chunk), chunks
+    )
+    return [rec for part in parts for rec in part]
+
+def _fetch_chunk_records(
+    indicator_code: str,
+    source: int | None,
+    page_workers: int | None,
+    start_year: int,
+    countries: list[str],
+) -> list:
+    """Todas las filas de la consulta para `countries`. La página 1 informa del total de páginas;
+    el resto se piden en paralelo (como mucho `page_workers`) y se concatenan en orden.
+
+    Cada página se reintenta por separado: las ya descargadas se conservan y
+    solo las que fallan de forma transitoria (429/5xx/red) se vuelven a pedir,
+    hasta WB_PAGE_RETRY_ROUNDS rondas adicionales."""
+    workers = page_workers or WB_PAGE_WORKERS
+    all_records = []
 
+    json_data = _fetch_page(indicator_code, 1, source, start_year, countries)
+    if len(json_data) >= 2 and json_data[1]:
+        all_records.extend(json_data[1])
         total_pages = json_data[0]["pages"]
-        if page >= total_pages:
-            break
+        pages: dict[int, list] = {}
+        pending = list(range(2, total_pages + 1))
+
+        def _try(p: int):
+            try:
+                return p, _fetch_page(indicator_code, p, source, start_year, countries), None
+            except Exception as e:
+                if not http.is_transient(e):
+                    raise
+                return p, None, e
+
+        for round_ in range(WB_PAGE_RETRY_ROUNDS + 1):
+            if not pending:
+                break
+            if round_:
+                log.warning("%s: reintentando %d página(s) fallidas (ronda %d)", indicator_code, len(pending), round_)
+            if workers > 1 and len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                    results = list(pool.map(_try, pending))
+            else:
+                results = [_try(p) for p in pending]
+            failed = [(p, err) for p, data, err in results if err is not None]
+            pages.update((p, data) for p, data, err in results if err is None)
+            pending = [p for p, _ in failed]
+        if pending:
+            raise failed[-1][1]
+
+        for p in sorted(pages):
+            page_data = pages[p]
+            if len(page_data) >= 2 and page_data[1]:
+                all_records.extend(page_data[1])
+    return all_records
 
-        page += 1
+def _normalize(all_records: list, indicator: str | dict[str, str]) -> pd.DataFrame:
+    """Filas WB → (country, year, indicator, value).
+
+    `indicator` es el nombre interno, o un dict código WB → nombre cuando las
+    filas mezclan varios indicadores (modo por lotes).
+    """
+    if ARROW_BACKEND:
+        return _normalize_arrow(all_records, indicator)
 
     # Convertir a DataFrame
     df = pd.DataFrame.from_records(all_records)
     if df.empty:
         return pd.DataFrame(columns=["country", "year", "indicator", "value"])
-    
+
+    if isinstance(indicator, dict):
+        names = df["indicator"].str.get("id").map(indicator)
     df = df[["countryiso3code", "date", "value"]]
     df.rename(columns={"countryiso3code": "country", "date": "year", "value": "value"}, inplace=True)
-    df["indicator"] = indicator_name
+    df["indicator"] = names if isinstance(indicator, dict) else indicator
 
     # Conversión de tipos
     df["year"] = pd.to_numeric(df["year"], errors="coerce")
     df["value"] = pd.to_numeric(df["value"], errors="coerce")
 
     # Filtrar y mapear códigos de país
-    df = df[df["country"].isin(COUNTRY_CODES.values())]
-    code_to_name = {v: k for k, v in COUNTRY_CODES.items()}
+    code_to_name = country_universe.code_to_name()
+    df = df[df["country"].isin(code_to_name.keys())]
     df["country"] = df["country"].map(code_to_name)
 
     return df[["country", "year", "indicator", "value"]].dropna(subset=["value"])
 
-def fetch_world_bank_data():
-    """Itera sobre lista de indicadores y concatena los que devuelven filas."""
-    indicators = [
-        # Demografía de población (existente)
-        ("SP.POP.TOTL", "population"),
-        ("SP.RUR.TOTL.ZS", "rural_population_pct"),
-        ("SP.POP.1564.TO.ZS", "population_15_64_pct"),
-        ("SP.POP.65UP.TO.ZS", "population_65_plus_pct"),
-        
-        # Salud y carga epidemiológica
-        ("SP.DYN.LE00.IN", "life_expectancy_total"),
-        ("SP.DYN.LE00.FE.IN", "life_expectancy_female"),
-        ("SP.DYN.LE00.MA.IN", "life_expectancy_male"),
-        ("SH.DYN.MORT", "under5_mortality_rate"),
-        ("SH.STA.MALN.ZS", "malnutrition_prevalence_under5"),
-        ("SH.STA.DIAB.ZS", "diabetes_prevalence_20_79"),
-        ("SH.STA.OWGH.ZS", "overweight_prevalence_under5"),
-        
-        # Economía y gasto sanitario
-        ("NY.GDP.MKTP.CD", "gdp_usd"),
-        ("NY.GDP.PCAP.CD", "gdp_per_capita_usd"),
-        ("SH.XPD.CHEX.GD.ZS", "health_expenditure_pct_gdp"),
-        ("SH.XPD.CHEX.PC.CD", "health_expenditure_per_capita_usd"),
-        
-        # Factores socioeconómicos
-        ("SI.POV.GINI", "gini_index"),
-        ("SI.POV.LMIC.GP", "poverty_headcount_320_day"),
-        ("SE.ADT.LITR.ZS", "adult_literacy_rate"),
-        ("SL.UEM.TOTL.ZS", "unemployment_rate")
+def _normalize_arrow(all_records: list, indicator: str | dict[str, str]) -> pd.DataFrame:
+    """Variante Arrow de _normalize: columnas Arrow construidas directamente desde
+    los registros (sin DataFrame intermedio de objetos)."""
+    code_to_name = country_universe.code_to_name()
+    names = indicator if isinstance(indicator, dict) else None
+    rows = [
+        (
+            code_to_name[r["countryiso3code"]],
+            r.get("date"),
+            names.get((r.get("indicator") or {}).get("id")) if names else indicator,
+            r["value"],
+        )
+        for r in all_records
+        if r.get("value") is not None and r.get("countryiso3code") in code_to_name
     ]
-    log.info("Extracción World Bank: %d indicadores", len(indicators))
-    
-    all_data = []
-    for indicator_code, indicator_name in indicators:
-        try:
-            df = fetch_world_bank_indicator(indicator_code, indicator_name)
-            if not df.empty:
-                all_data.append(df)
-                log.info("Descargadas %s filas para %s", len(df), indicator_name)
-            else:
-                log.warning("Sin datos para %s", indicator_name)
-        except Exception as e:
-            log.error("Error al obtener %s: %s", indicator_name, e)
-    
+    country, year, name, value = zip(*rows) if rows else ((), (), (), ())
+    return arrow_long(pa.table({
+        "country": pa.array(country, pa.string()),
+        "year": numeric_arrow(pd.Series(year, dtype="string[pyarrow]"), pa.int16()),
+        "indicator": pa.array(name, pa.string()),
+        "value": pa.array(value, pa.float64()),
+    }))
+
+def fetch_world_bank_indicator(
+    indicator_code: str,
+    indicator_name: str,
+    page_workers: int | None = None,
+    start_year: int = WB_START_YEAR,
+):
+    """Descarga un indicador (todas las páginas desde `start_year`) y normaliza columnas."""
+    return _normalize(_fetch_records(indicator_code, page_workers=page_workers, start_year=start_year), indicator_name)
+
+def fetch_world_bank_batch(
+    indicators: list[tuple[str, str]],
+    source: int = WDI_SOURCE,
+    start_year: int = WB_START_YEAR,
+) -> dict[str, pd.DataFrame]:
+    """Descarga varios indicadores de una misma fuente en una sola consulta paginada.
+
+    Devuelve {nombre interno: DataFrame} (vacío para los indicadores sin filas),
+    con las mismas filas que fetch_world_bank_indicator por separado.
+    """
+    codes = ";".join(code for code, _ in indicators)
+    df = _normalize(_fetch_records(codes, source, start_year=start_year), dict(indicators))
+    return {name: df[df["indicator"] == name] for _, name in indicators}
+
+def _fetch_safe(indicator_code: str, indicator_name: str, start_year: int = WB_START_YEAR):
+    """Envuelve fetch_world_bank_indicator: un fallo no aborta el resto de indicadores."""
+    try:
+        df = fetch_world_bank_indicator(indicator_code, indicator_name, start_year=start_year)
+    except Exception as e:
+        log.error("Error al obtener %s: %s", indicator_name, e)
+        return None
+    if df.empty:
+        log.warning("Sin datos para %s", indicator_name)
+        return None
+    log.info("Descargadas %s filas para %s", len(df), indicator_name)
+    return df
+
+def _fetch_one(indicator_code: str, indicator_name: str, start_year: int = WB_START_YEAR) -> dict:
+    return {indicator_name: _fetch_safe(indicator_code, indicator_name, start_year)}
+
+def _fetch_group(indicators: list[tuple[str, str]], source: int, start_year: int = WB_START_YEAR) -> dict:
+    """Lote de indicadores de una fuente; si la consulta falla se piden uno a uno."""
+    try:
+        frames = fetch_world_bank_batch(indicators, source, start_year)
+    except Exception as e:
+        log.warning("Lote World Bank (source=%s) fallido (%s); se piden indicadores por separado", source, e)
+        return {name: _fetch_safe(code, name, start_year) for code, name in indicators}
+    out = {}
+    for _, name in indicators:
+        df = frames[name]
+        if df.empty:
+            log.warning("Sin datos para %s", name)
+            out[name] = None
+        else:
+            log.info("Descargadas %s filas para %s", len(df), name)
+            out[name] = df
+    return out
+
+def extraction_tasks(since: dict[str, Watermark] | None = None) -> list:
+    """Unidades de descarga (función, args); cada una devuelve {nombre: DataFrame | None}.
+
+    En modo por lotes se agrupan los indicadores por (fuente WB, año inicial)
+    en bloques de WB_BATCH_SIZE; si no, una tarea por indicador. Con marcas de
+    agua (`since`) cada indicador se pide solo desde su último año cargado.
+    """
+    first = {name: _start_year(since, name, WB_START_YEAR) for _, name in INDICATORS}
+    if not WB_BATCH:
+        return [(_fetch_one, (code, name, first[name])) for code, name in INDICATORS]
+    groups: dict[tuple[int, int], list] = {}
+    for code, name in INDICATORS:
+        groups.setdefault((INDICATOR_SOURCES.get(code, WDI_SOURCE), first[name]), []).append((code, name))
+    return [
+        (_fetch_group, (group[i:i + WB_BATCH_SIZE], source, year))
+        for (source, year), group in groups.items()
+        for i in range(0, len(group), WB_BATCH_SIZE)
+    ]
+
+def fetch_world_bank_data(max_workers: int | None = None, since: dict[str, Watermark] | None = None):
+    """Itera sobre lista de indicadores y concatena los que devuelven filas.
+
+    Con `max_workers` > 1 se ejecutan varias descargas a la vez; el orden
+    de concatenación sigue siendo el de INDICATORS, así que la salida es la
+    misma que en modo secuencial (y que en modo por lotes). Con `since`
+    (marcas de agua por indicador) solo se descarga el delta de años.
+    """
+    workers = max_workers or WB_MAX_WORKERS
+    tasks = extraction_tasks(since)
+    log.info(
+        "Extracción World Bank: %d indicadores en %d consultas (concurrencia=%d)",
+        len(INDICATORS), len(tasks), workers,
+    )
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda t: t[0](*t[1]), tasks))
+    else:
+        results = [fn(*args) for fn, args in tasks]
+    return _combine(results)
+
+def _combine(results: list[dict]):
+    """Concatena en el orden de INDICATORS los indicadores con filas (None = fallo o vacío)
+    y compacta tipos (utils.long_frame)."""
+    by_name = {name: df for res in results for name, df in res.items()}
+    all_data = [by_name[name] for _, name in INDICATORS if by_name.get(name) is not None]
+
     if all_data:
-        out = pd.concat(all_data, ignore_index=True)
+        out = compact_long(pd.concat(all_data, ignore_index=True))
         log.info("Extracción World Bank total: %s filas", len(out))
         return out
     else:
         log.warning("Extracción World Bank vacía (0 filas)")
-        return pd.DataFrame(columns=["country", "year", "indicator", "value"])
+        return empty_long()
 
 if __name__ == "__main__":
     df = fetch_world_bank_data()
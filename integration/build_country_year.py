@@ -1,7 +1,7 @@
 import os
 from typing import List, Tuple
-from sqlalchemy import create_engine, text
-from utils.db import sqlalchemy_url_from_jdbc
+from sqlalchemy import text
+from utils.db import get_engine
 from utils.config import DEFAULT_STAGING_SCHEMA, DEFAULT_MART_SCHEMA
 from utils.logging import get_logger
 
@@ -17,14 +17,6 @@ SOURCES: List[Tuple[str, str]] = [
     ("who_diabetes_obesity", "who"),
 ]
 
-def _engine():
-    jdbc = os.getenv("POSTGRES_URL")
-    user = os.getenv("POSTGRES_USER")
-    pw   = os.getenv("POSTGRES_PASSWORD")
-    if not jdbc or not user or not pw:
-        raise RuntimeError("Missing POSTGRES_URL/USER/PASSWORD in env")
-    return create_engine(sqlalchemy_url_from_jdbc(jdbc, user, pw), future=True)
-
 def _table_exists(conn, schema: str, table: str) -> bool:
     q = text("""
         SELECT 1
@@ -66,12 +58,12 @@ def _ensure_mart_table(conn):
         END$$;
     """))
 
-def build_mart(year_min: int = 1990):
+def build_mart(year_min: int = 1990, year_max: int | None = None):
     """
     Fusiona staging priorizando SDMX > World Bank > WHO.
-    Reemplaza/actualiza valores existentes.
+    Reemplaza/actualiza valores existentes dentro de la ventana [year_min, year_max].
     """
-    eng = _engine()
+    eng = get_engine()
     with eng.begin() as conn:
         _ensure_mart_table(conn)
 
@@ -111,7 +103,8 @@ def build_mart(year_min: int = 1990):
                        ) AS rn
                 FROM unioned u
                 WHERE country IS NOT NULL AND indicator IS NOT NULL AND "year" IS NOT NULL
-                  AND "year" >= {year_min}
+                  AND "year" >= {int(year_min)}
+                  {f'AND "year" <= {int(year_max)}' if year_max is not None else ''}
             )
             INSERT INTO "{MART_SCHEMA}"."{MART_TABLE}" (country, "year", indicator, value, source, load_ts)
             SELECT country, "year", indicator, value, source, NOW()
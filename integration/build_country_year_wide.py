@@ -1,7 +1,7 @@
 # integration/build_country_year_wide.py
 import os
-from sqlalchemy import create_engine, text
-from utils.db import sqlalchemy_url_from_jdbc
+from sqlalchemy import text
+from utils.db import get_engine
 from utils.logging import get_logger
 
 log = get_logger(__name__)
@@ -23,14 +23,6 @@ INDICATORS_WIDE = [
     ("overweight_adults",                         "overweight_adults"),
 ]
 
-def _engine():
-    jdbc = os.getenv("POSTGRES_URL")
-    user = os.getenv("POSTGRES_USER")
-    pw   = os.getenv("POSTGRES_PASSWORD")
-    if not jdbc or not user or not pw:
-        raise RuntimeError("Faltan POSTGRES_URL/USER/PASSWORD en el entorno")
-    return create_engine(sqlalchemy_url_from_jdbc(jdbc, user, pw), future=True)
-
 def _create_wide_table(conn):
     # Genera SQL de pivote usando agregaciones condicionales
     select_parts = []
@@ -68,7 +60,7 @@ def _create_wide_table(conn):
 
 def build_country_year_wide():
     """Regenera tabla wide según lista fija de indicadores."""
-    eng = _engine()
+    eng = get_engine()
     with eng.begin() as conn:
         _create_wide_table(conn)
     log.info("Recreada %s.country_year_wide", MART)
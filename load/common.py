@@ -0,0 +1,73 @@
+"""Carga masiva en staging, común a los tres loaders.
+
+`copy_to_temp(conn, df, table)` crea una tabla `TEMP ... ON COMMIT DROP`
+(sin WAL, visible solo en la sesión de `conn` y borrada al cerrar la
+transacción, también si hay rollback) y la rellena con
+`COPY ... FROM STDIN WITH (FORMAT csv)`. El CSV lo genera pyarrow en código
+nativo sobre un buffer en memoria, tanto para columnas category/numpy como
+Arrow (PANDAS_DTYPE_BACKEND=pyarrow), sin convertir filas a objetos Python.
+
+Cada loader ejecuta después su upsert desde la tabla temporal, en la misma
+transacción:
+    with engine.begin() as conn:
+        copy_to_temp(conn, df, "_tmp_who")
+        conn.execute(text('INSERT INTO ... SELECT ... FROM "_tmp_who" ...'))
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from sqlalchemy import text
+
+from utils.logging import get_logger
+
+log = get_logger(__name__)
+
+# Tipo Postgres de cada tipo Arrow de columna
+_PG_TYPES = (
+    (pa.types.is_string, "TEXT"),
+    (pa.types.is_large_string, "TEXT"),
+    (lambda t: pa.types.is_integer(t) and t.bit_width <= 16, "SMALLINT"),
+    (lambda t: pa.types.is_integer(t) and t.bit_width <= 32, "INTEGER"),
+    (pa.types.is_integer, "BIGINT"),
+    (pa.types.is_floating, "DOUBLE PRECISION"),
+    (pa.types.is_boolean, "BOOLEAN"),
+)
+
+
+def _pg_type(type_: pa.DataType) -> str:
+    for check, pg in _PG_TYPES:
+        if check(type_):
+            return pg
+    return "TEXT"
+
+
+def _arrow_table(df: pd.DataFrame) -> pa.Table:
+    """DataFrame → tabla Arrow sin índice; las category (diccionarios) pasan a su tipo de valor."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table.replace_schema_metadata(None)
+
+
+def copy_to_temp(conn, df: pd.DataFrame, table: str) -> int:
+    """Sube `df` con COPY a la tabla temporal `table` (ON COMMIT DROP) de la transacción de `conn`.
+
+    Devuelve el nº de filas copiadas.
+    """
+    data = _arrow_table(df)
+    columns = ", ".join(f'"{f.name}" {_pg_type(f.type)}' for f in data.schema)
+    conn.execute(text(f'CREATE TEMP TABLE "{table}" ({columns}) ON COMMIT DROP'))
+
+    sink = pa.BufferOutputStream()
+    pacsv.write_csv(data, sink, write_options=pacsv.WriteOptions(include_header=False))
+    names = ", ".join(f'"{name}"' for name in data.column_names)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table}" ({names}) FROM STDIN WITH (FORMAT csv)', pa.BufferReader(sink.getvalue()))
+        return cursor.rowcount if cursor.rowcount >= 0 else data.num_rows
+    finally:
+        cursor.close()
@@ -1,21 +1,26 @@
 # Secuencia general del pipeline:
 # extract -> transform -> load (staging) -> integración MART -> publicación opcional Spark
+# (PIPELINE_MODE=stream: extract/transform/load por trozos y las tres fuentes a la vez)
 
 from __future__ import annotations
 
+import argparse
 import os
 import sys
-from typing import Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Any, Iterable
 from dotenv import load_dotenv
 
 from utils.logging import setup_logging, get_logger
-from utils.db import sqlalchemy_url_from_jdbc
-from sqlalchemy import create_engine, text
+from utils.db import get_engine, dispose_engines
+from sqlalchemy import text
 
 # Import específico de cada dominio (extract / transform / load)
 from extract.who_gho import get_diabetes_obesity_data
 from extract.world_bank import fetch_world_bank_data
 from extract import sdmx as sdmx_mod
+from extract.engine import extract_all, iter_source
 
 from transform.who_gho_transform import transform_who
 from transform.world_bank_transform import transform_worldbank_population
@@ -36,27 +41,24 @@ try:
 except Exception:
     spark_publish = None
 
-from utils.runlog import step_run, ensure_run_log_table, set_rows_out
-from extract.constants import COUNTRY_CODES
+from utils.runlog import (
+    step_run, ensure_run_log_table, set_rows_out, set_fingerprint, last_fingerprint, last_step_ok,
+)
+from utils.fingerprint import FrameFingerprint, frame_fingerprint
+from utils.watermark import ensure_watermark_table, read_watermarks, update_watermarks
+from utils import http, landing
+from utils.stream import staged
+from utils.config import YEAR_MIN, YEAR_MAX
+from extract.countries import country_codes
 
 load_dotenv()
 log = get_logger(__name__)
 
-POSTGRES_URL = os.getenv("POSTGRES_URL")
-POSTGRES_USER = os.getenv("POSTGRES_USER")
-POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 STAGING = os.getenv("STAGING_SCHEMA", "staging")
 MART = os.getenv("MART_SCHEMA", "mart")
 
-YEAR_MIN = int(os.getenv("YEAR_MIN", "1990"))  # recorte inferior global de año
-
-
-def _engine():
-    """Crea el engine SQLAlchemy (valida credenciales básicas)."""
-    if not POSTGRES_URL or not POSTGRES_USER or not POSTGRES_PASSWORD:
-        raise RuntimeError("Faltan POSTGRES_URL/USER/PASSWORD en el entorno")
-    sa_url = sqlalchemy_url_from_jdbc(POSTGRES_URL, POSTGRES_USER, POSTGRES_PASSWORD)
-    return create_engine(sa_url)
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "serial").lower()  # serial | async
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "batch").lower()  # batch | stream
 
 
 def _ensure_schemas(engine):
@@ -65,32 +67,59 @@ def _ensure_schemas(engine):
         conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {MART};"))
 
 
+def _year_window(tdf):
+    """Filtra YEAR_MIN/YEAR_MAX si hay columna 'year' (salvaguarda: los extractores ya la piden en origen)."""
+    if hasattr(tdf, "__getitem__") and hasattr(tdf, "columns") and "year" in getattr(tdf, "columns", []):
+        try:
+            in_window = tdf["year"] >= YEAR_MIN
+            if YEAR_MAX is not None:
+                in_window &= tdf["year"] <= YEAR_MAX
+            tdf = tdf[in_window]
+        except Exception:
+            pass
+    return tdf
+
+
 def _etl(
     engine,
     prefix: str,
     extract_fn: Callable[[], Any],
     transform_fn: Callable[[Any], Any],
     load_fn: Callable[[Any], None],
-):
+    extracted_at: datetime | None = None,
+    force: bool = False,
+    landing_run: str | None = None,
+) -> bool:
     """
     Ejecuta el patrón E-T-L para una fuente.
-    Registra pasos en run_log y aplica filtro YEAR_MIN si hay columna 'year'.
+    Registra pasos en run_log y aplica la ventana YEAR_MIN/YEAR_MAX si hay columna 'year'
+    (los extractores ya la piden en origen; aquí es solo una salvaguarda).
+    Con `landing_run` el extracto se guarda además en la zona de landing.
+    Si la huella del extracto coincide con la del último load OK (y no se
+    fuerza) se omiten transform y load. Devuelve True si se ha cargado algo.
+    Tras cargar, avanza las marcas de agua de los indicadores cargados.
     """
     # Extract
+    extracted_at = extracted_at or datetime.now(timezone.utc)
     with step_run(engine, f"extract_{prefix}") as rid:
         raw = extract_fn()
+        fingerprint = frame_fingerprint(raw)
+        if landing_run:
+            try:
+                landing.save_frame(prefix, landing_run, raw)
+            except Exception as e:
+                log.warning("No se pudo guardar el extracto %s en landing: %s", prefix, e)
         try:
             set_rows_out(engine, rid, len(raw))
+            set_fingerprint(engine, rid, fingerprint)
         except Exception:
             pass
+    if not force and fingerprint == last_fingerprint(engine, f"load_{prefix}"):
+        log.info("%s sin cambios (huella %s): se omiten transform y load", prefix, fingerprint[:12])
+        return False
     # Transform
     with step_run(engine, f"transform_{prefix}", rows_in=len(raw) if hasattr(raw, "__len__") else None) as rid:
-        tdf = transform_fn(raw)
-        if hasattr(tdf, "__getitem__") and hasattr(tdf, "columns") and "year" in getattr(tdf, "columns", []):
-            try:
-                tdf = tdf[tdf["year"] >= YEAR_MIN]
-            except Exception:
-                pass
+        tdf = _year_window(transform_fn(raw))
         try:
             set_rows_out(engine, rid, len(tdf))
         except Exception:
@@ -102,6 +131,56 @@ def _etl(
             set_rows_out(engine, rid, len(tdf))
         except Exception:
             pass
+        set_fingerprint(engine, rid, fingerprint)
+    update_watermarks(engine, prefix, tdf, extracted_at)
+    return True
+
+
+def _etl_stream(
+    engine,
+    prefix: str,
+    chunks: Iterable[Any],
+    transform_fn: Callable[[Any], Any],
+    load_fn: Callable[[Any], None],
+    extracted_at: datetime | None = None,
+    landing_run: str | None = None,
+) -> bool:
+    """
+    Variante por trozos de _etl (PIPELINE_MODE=stream).
+    Cada trozo del extractor (un indicador o lote) se transforma en un hilo
+    propio y se carga aquí según llega, con colas acotadas entre etapas: red,
+    CPU y Postgres se solapan y la memoria depende del tamaño de trozo, no
+    del de la fuente. Los trozos no comparten indicadores, así que el upsert
+    por trozo deja staging igual que la carga completa; las marcas de agua
+    avanzan con cada trozo cargado.
+    La huella del extracto se acumula y se registra al final en load_<prefix>:
+    no evita esta carga (los datos ya están subidos) pero sí las de siguientes
+    ejecuciones batch. Devuelve True si se ha cargado algo distinto de la última vez.
+    """
+    extracted_at = extracted_at or datetime.now(timezone.utc)
+    previous = last_fingerprint(engine, f"load_{prefix}")
+    fingerprint = FrameFingerprint()
+    rows_in = rows_out = 0
+    with step_run(engine, f"load_{prefix}") as rid, landing.frame_writer(prefix, landing_run) as landing_out:
+
+        def _transform(raw):
+            fingerprint.update(raw)
+            landing_out.write(raw)
+            return len(raw), _year_window(transform_fn(raw))
+
+        for n_raw, tdf in staged(chunks, _transform, name=f"transform-{prefix}"):
+            rows_in += n_raw
+            if len(tdf):
+                load_fn(tdf)
+                update_watermarks(engine, prefix, tdf, extracted_at)
+                rows_out += len(tdf)
+        try:
+            set_rows_out(engine, rid, rows_out)
+        except Exception:
+            pass
+        set_fingerprint(engine, rid, fingerprint.hexdigest())
+    log.info("%s en streaming: %s filas extraídas, %s cargadas", prefix, rows_in, rows_out)
+    return rows_out > 0 and fingerprint.hexdigest() != previous
 
 
 def _count(engine, schema: str, table: str) -> int | None:
@@ -112,55 +191,149 @@ def _count(engine, schema: str, table: str) -> int | None:
         return None
 
 
-def main():
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pipeline WHO / World Bank / OECD → staging → MART")
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Ignora las marcas de agua y descarga el histórico completo de todas las fuentes",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ejecuta transform/load, integración y publicación aunque ninguna fuente haya cambiado",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="RUN",
+        help="Reprocesa sin red los extractos de la zona de landing de una ejecución (run_id o 'latest')",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
     """Orquestación completa con manejo controlado de fallos."""
+    args = _parse_args(argv)
     setup_logging()
     try:
-        engine = _engine()
+        engine = get_engine()  # el mismo engine (y pool) que usan loaders e integraciones
     except Exception:
         log.exception("No se pudo crear el engine de SQLAlchemy")
         sys.exit(2)
 
     _ensure_schemas(engine)
     ensure_run_log_table(engine)
+    ensure_watermark_table(engine)
 
+    sources = ("who", "worldbank", "sdmx")
+    force = args.force
     try:
-        _etl(engine, "who", get_diabetes_obesity_data, transform_who, load_who_gho_to_postgres)
-        _etl(engine, "worldbank", fetch_world_bank_data, transform_worldbank_population, load_world_bank_to_postgres)
-        _etl(engine, "sdmx", sdmx_mod.get_health_expenditure_data, transform_sdmx, load_sdmx_to_postgres)
+        if args.replay:
+            # Reproceso offline: los extractos salen de la zona de landing y se
+            # fuerza transform/load (la huella coincide con la de la carga original).
+            run_id = landing.resolve_run(args.replay, sources)
+            log.info("Replay de la ejecución %s desde %s (sin red)", run_id, landing.LANDING_DIR)
+            extractors = {src: (lambda src=src: landing.load_frame(src, run_id)) for src in sources}
+            extracted_at, landing_run, force = landing.run_timestamp(run_id), None, True
+        else:
+            # Marcas de agua por fuente/indicador: solo se extrae el delta
+            if args.full_refresh:
+                log.info("Extracción completa (--full-refresh): se ignoran las marcas de agua")
+                since = {}
+            else:
+                since = {src: read_watermarks(engine, src) for src in sources}
+                log.info(
+                    "Extracción incremental: %s",
+                    ", ".join(f"{src}={len(wms)} marcas" for src, wms in since.items()),
+                )
+
+            extractors = {
+                "who": lambda: get_diabetes_obesity_data(since=since.get("who")),
+                "worldbank": lambda: fetch_world_bank_data(since=since.get("worldbank")),
+                "sdmx": lambda: sdmx_mod.get_health_expenditure_data(since=since.get("sdmx")),
+            }
+            landing_run = landing.start_run()
+            extracted_at = landing.run_timestamp(landing_run) if landing_run else None
+
+        if PIPELINE_MODE == "stream" and not args.replay:
+            # Las tres fuentes a la vez; en cada una, extract/transform/load por trozos
+            extracted_at = extracted_at or datetime.now(timezone.utc)
+            stages = {
+                "who": (transform_who, load_who_gho_to_postgres),
+                "worldbank": (transform_worldbank_population, load_world_bank_to_postgres),
+                "sdmx": (transform_sdmx, load_sdmx_to_postgres),
+            }
+            with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="etl") as pool:
+                futures = [
+                    pool.submit(_etl_stream, engine, src, iter_source(src, since.get(src)),
+                                transform_fn, load_fn, extracted_at, landing_run)
+                    for src, (transform_fn, load_fn) in stages.items()
+                ]
+                changed = [f.result() for f in futures]
+        else:
+            if EXTRACT_MODE == "async" and not args.replay:
+                # Todas las peticiones de las tres fuentes en un único event loop;
+                # cada _etl recibe después el DataFrame ya extraído de su fuente.
+                extracted_at = extracted_at or datetime.now(timezone.utc)
+                with step_run(engine, "extract_async") as rid:
+                    raws = extract_all(since=since)
+                    try:
+                        set_rows_out(engine, rid, sum(len(df) for df in raws.values()))
+                    except Exception:
+                        pass
+                extractors = {src: (lambda df=df: df) for src, df in raws.items()}
+
+            changed = [
+                _etl(engine, "who", extractors["who"], transform_who, load_who_gho_to_postgres,
+                     extracted_at, force, landing_run),
+                _etl(engine, "worldbank", extractors["worldbank"], transform_worldbank_population,
+                     load_world_bank_to_postgres, extracted_at, force, landing_run),
+                _etl(engine, "sdmx", extractors["sdmx"], transform_sdmx, load_sdmx_to_postgres,
+                     extracted_at, force, landing_run),
+            ]
     except Exception:
         log.exception("Fallo en alguna etapa de Extract/Transform/Load")
         sys.exit(1)
+    finally:
+        http.log_stats()
 
-    try:
-        # Construcción de dimensiones y hechos (versión larga y ancha)
-        with step_run(engine, "integration_dim_country", rows_in=len(COUNTRY_CODES)) as rid:
-            build_dim_country()
-            cnt_dim = _count(engine, MART, "dim_country")
-            if cnt_dim is not None:
-                set_rows_out(engine, rid, cnt_dim)
-
-        rows_in_long = sum((_count(engine, STAGING, tbl) or 0) for tbl, _src in SOURCES)
-        with step_run(engine, "integration_long", rows_in=rows_in_long) as rid:
-            build_mart(year_min=YEAR_MIN)
-            cnt_long = _count(engine, MART, "country_year_indicators")
-            if cnt_long is not None:
-                set_rows_out(engine, rid, cnt_long)
-
-        rows_in_wide = sum((_count(engine, MART, t) or 0) for t in ("dim_country", "country_year_indicators"))
-        with step_run(engine, "integration_wide_sql", rows_in=rows_in_wide) as rid:
-            build_country_year_wide()
-            cnt_wide = _count(engine, MART, "country_year_wide")
-            if cnt_wide is not None:
-                set_rows_out(engine, rid, cnt_wide)
-        log.info("MART listo: dim_country, tabla long y derivada wide (SQL).")
-    except Exception:
-        log.exception("Fallo en la integración SQL de MART")
-        sys.exit(1)
+    # Sin cambios en staging y con la última integración completa: MART ya está al día
+    integration_steps = ("integration_dim_country", "integration_long", "integration_wide_sql")
+    mart_pending = force or any(changed) or not all(last_step_ok(engine, s) for s in integration_steps)
+    if not mart_pending:
+        log.info("Ninguna fuente ha cambiado: se omite la integración MART.")
+    else:
+        try:
+            # Construcción de dimensiones y hechos (versión larga y ancha)
+            with step_run(engine, "integration_dim_country", rows_in=len(country_codes())) as rid:
+                build_dim_country()
+                cnt_dim = _count(engine, MART, "dim_country")
+                if cnt_dim is not None:
+                    set_rows_out(engine, rid, cnt_dim)
+
+            rows_in_long = sum((_count(engine, STAGING, tbl) or 0) for tbl, _src in SOURCES)
+            with step_run(engine, "integration_long", rows_in=rows_in_long) as rid:
+                build_mart(year_min=YEAR_MIN, year_max=YEAR_MAX)
+                cnt_long = _count(engine, MART, "country_year_indicators")
+                if cnt_long is not None:
+                    set_rows_out(engine, rid, cnt_long)
+
+            rows_in_wide = sum((_count(engine, MART, t) or 0) for t in ("dim_country", "country_year_indicators"))
+            with step_run(engine, "integration_wide_sql", rows_in=rows_in_wide) as rid:
+                build_country_year_wide()
+                cnt_wide = _count(engine, MART, "country_year_wide")
+                if cnt_wide is not None:
+                    set_rows_out(engine, rid, cnt_wide)
+            log.info("MART listo: dim_country, tabla long y derivada wide (SQL).")
+        except Exception:
+            log.exception("Fallo en la integración SQL de MART")
+            sys.exit(1)
 
     # Publicación Spark (omisible vía variable de entorno)
     if os.getenv("SKIP_SPARK_PUBLISH", "0") == "1":
         log.info("Publicación Spark deshabilitada por configuración.")
+    elif not mart_pending and last_step_ok(engine, "publish_spark"):
+        log.info("MART sin cambios y ya publicado: se omite publicación Spark.")
     elif spark_publish:
         try:
             with step_run(engine, "publish_spark"):
@@ -171,6 +344,7 @@ def main():
     else:
         log.warning("PySpark no disponible: se omite fase de publicación.")
 
+    dispose_engines()
     log.info("Pipeline OK")
 
 
@@ -0,0 +1,232 @@
+"""Normalización común al formato largo (country, year, indicator, value).
+
+Una sola pasada para las tres fuentes, sin copias intermedias:
+    - Copy-on-write: seleccionar/renombrar columnas no duplica datos.
+    - Cada columna se convierte una vez (texto → category normalizando solo
+      los valores distintos; año → int16; valor → float64).
+    - Un único filtro de nulos sobre las cuatro columnas.
+    - Deduplicación (media por clave) sobre una única clave entera compuesta
+      de los códigos de país/indicador y el año, en vez de un groupby de tres
+      claves (que materializa varios arrays int64 por clave).
+
+Con PANDAS_DTYPE_BACKEND=pyarrow el mismo recorrido se hace en pyarrow.compute
+(strip/upper, filtro, group_by().aggregate(mean) y orden en código nativo) y
+el resultado sale con columnas Arrow.
+
+Con TRANSFORM_WORKERS > 1 (solo modo numpy) la deduplicación de frames
+grandes se reparte por indicador entre procesos (ver transform.parallel).
+"""
+
+from __future__ import annotations
+import os
+from typing import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.logging import get_logger
+from utils.long_frame import (
+    ARROW_BACKEND, LONG_COLUMNS, VALUE_DTYPE, YEAR_DTYPE, arrow_long, as_category, empty_long, numeric_arrow,
+    to_arrow,
+)
+
+log = get_logger(__name__)
+
+KEYS = ["country", "year", "indicator"]
+
+# Procesos para la deduplicación (1 = en el propio proceso) y tamaño mínimo
+# del frame para repartirla (por debajo no compensa el coste de los procesos)
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", "1"))
+TRANSFORM_PARALLEL_MIN_ROWS = int(os.getenv("TRANSFORM_PARALLEL_MIN_ROWS", "1000000"))
+_CPUS_WARNED = False
+
+
+def _use_parallel(rows: int) -> bool:
+    """True si la deduplicación de `rows` filas se reparte entre procesos.
+
+    Con menos núcleos que TRANSFORM_WORKERS el pool solo añade coste: en serie.
+    """
+    global _CPUS_WARNED
+    if TRANSFORM_WORKERS <= 1 or rows < TRANSFORM_PARALLEL_MIN_ROWS:
+        return False
+    cpus = os.cpu_count() or 1
+    if cpus < TRANSFORM_WORKERS:
+        if not _CPUS_WARNED:
+            log.warning("TRANSFORM_WORKERS=%d con %d núcleos: deduplicación en serie", TRANSFORM_WORKERS, cpus)
+            _CPUS_WARNED = True
+        return False
+    return True
+
+
+def _pick_first_present(df: pd.DataFrame, candidates: Sequence[str]) -> str | None:
+    for c in candidates:
+        if c in df.columns:
+            return c
+    return None
+
+
+def _typed(df: pd.DataFrame, cols: dict[str, str | None], default_indicator: str | None) -> pd.DataFrame:
+    """Columnas de origen → country/indicator category normalizados, year/value numéricos (con nulos)."""
+    indicator = (
+        as_category(df[cols["indicator"]], lambda s: s.str.strip())
+        if cols["indicator"] is not None
+        else pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[default_indicator])
+    )
+    return pd.DataFrame({
+        "country": as_category(df[cols["country"]], lambda s: s.str.strip().str.upper()),
+        "year": pd.to_numeric(df[cols["year"]], errors="coerce"),
+        "indicator": indicator,
+        "value": pd.to_numeric(df[cols["value"]], errors="coerce"),
+    }, index=df.index, copy=False)
+
+
+def _drop_nulls(out: pd.DataFrame) -> pd.DataFrame:
+    """Único filtro de nulos (claves y valor) y tipos compactos de year/value."""
+    valid = out.notna().all(axis=1)
+    if not valid.all():
+        out = out[valid]
+    return out.astype({"year": YEAR_DTYPE, "value": VALUE_DTYPE})
+
+
+def _mean_by_key(df: pd.DataFrame) -> pd.DataFrame:
+    """Equivale a groupby(KEYS, observed=True).mean() con salida en orden de clave.
+
+    Clave = (país, año, indicador) codificada en un int64. Si el rango de claves
+    es denso (≤ 2× filas) el código de grupo sale de un bincount + cumsum (sin
+    tabla hash); si no, de `factorize(sort=True)`. `bincount` da las sumas y
+    recuentos por grupo. Sin duplicados solo se reordenan las filas.
+    """
+    country, indicator = df["country"].array, df["indicator"].array
+    year = df["year"].to_numpy()
+    y0 = int(year.min()) if len(year) else 0
+    n_years = int(year.max()) - y0 + 1 if len(year) else 1
+    n_ind = max(1, len(indicator.categories))
+    # Operaciones in situ: un único array int64 temporal
+    key = country.codes.astype(np.int64)
+    key *= n_years
+    key += year
+    key -= y0
+    key *= n_ind
+    key += indicator.codes
+    n_keys = len(country.categories) * n_years * n_ind
+    if n_keys <= 2 * len(key) + 1:
+        present = np.bincount(key, minlength=n_keys) > 0
+        rank = np.cumsum(present) - 1
+        codes, uniques = rank[key], np.flatnonzero(present)
+        del present, rank
+    else:
+        codes, uniques = pd.factorize(key, sort=True)
+    del key
+
+    if len(uniques) == len(codes):
+        order = np.empty_like(codes)
+        order[codes] = np.arange(len(codes))
+        return df.take(order).reset_index(drop=True)
+
+    mean = np.bincount(codes, weights=df["value"].to_numpy(np.float64), minlength=len(uniques))
+    mean /= np.bincount(codes, minlength=len(uniques))
+    del codes
+    rest, ind_codes = np.divmod(uniques, n_ind)
+    country_codes, year_off = np.divmod(rest, n_years)
+    del rest
+    return pd.DataFrame({
+        "country": pd.Categorical.from_codes(country_codes, dtype=country.dtype),
+        "year": (year_off + y0).astype(YEAR_DTYPE),
+        "indicator": pd.Categorical.from_codes(ind_codes, dtype=indicator.dtype),
+        "value": mean,
+    })
+
+
+def _encode_arrow(values, normalize) -> tuple[pa.Array, pa.Array]:
+    """Texto → (códigos int32, etiquetas ordenadas), normalizando solo los valores distintos.
+
+    Equivalente Arrow de `as_category`: el texto se codifica una vez con
+    `dictionary_encode` y strip/upper, deduplicado y orden se aplican al diccionario.
+    """
+    arr = to_arrow(values, pa.string())
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()  # un único diccionario para toda la columna
+    encoded = pc.dictionary_encode(arr)
+    labels = normalize(encoded.dictionary)
+    categories = pc.unique(labels)
+    categories = pc.take(categories, pc.sort_indices(categories))
+    remap = pc.index_in(labels, value_set=categories).cast(pa.int32())
+    return pc.take(remap, encoded.indices), categories
+
+
+def _normalize_arrow(
+    df: pd.DataFrame, cols: dict[str, str | None], default_indicator: str | None, sort_by: Sequence[str] | None
+) -> pd.DataFrame:
+    """Variante Arrow de normalize_long: todo el trabajo en pyarrow.compute.
+
+    País e indicador se agrupan y ordenan por códigos int32 de diccionarios
+    ordenados (como los category del modo numpy) y se decodifican al final.
+    """
+    country, countries = _encode_arrow(df[cols["country"]], lambda a: pc.utf8_upper(pc.utf8_trim_whitespace(a)))
+    if cols["indicator"] is not None:
+        indicator, indicators = _encode_arrow(df[cols["indicator"]], pc.utf8_trim_whitespace)
+    else:
+        indicator = pa.array(np.zeros(len(df), dtype=np.int32))
+        indicators = pa.array([default_indicator], pa.string())
+    table = pa.table({
+        "country": country,
+        "year": numeric_arrow(df[cols["year"]], pa.int16()),
+        "indicator": indicator,
+        "value": numeric_arrow(df[cols["value"]]),
+    })
+    # Único filtro de nulos (claves y valor)
+    valid = pc.is_valid(table["country"])
+    for name in ("year", "indicator", "value"):
+        valid = pc.and_(valid, pc.is_valid(table[name]))
+    table = table.filter(valid)
+
+    out = table.group_by(KEYS, use_threads=False).aggregate([("value", "mean")])
+    out = out.rename_columns(["value" if name == "value_mean" else name for name in out.column_names])
+    out = out.sort_by([(k, "ascending") for k in (sort_by or KEYS)])
+    out = out.set_column(out.schema.get_field_index("country"), "country", pc.take(countries, out["country"]))
+    out = out.set_column(out.schema.get_field_index("indicator"), "indicator", pc.take(indicators, out["indicator"]))
+    return arrow_long(out)
+
+
+def normalize_long(
+    df: pd.DataFrame | None,
+    source: str,
+    aliases: Mapping[str, Sequence[str]] | None = None,
+    default_indicator: str | None = None,
+    sort_by: Sequence[str] | None = None,
+) -> pd.DataFrame:
+    """Normaliza `df` al formato largo compacto y promedia duplicados por clave.
+
+    `aliases`: columna destino → columnas de origen candidatas (gana la primera
+    presente); por defecto, los nombres estándar. Sin columna de indicador se
+    usa `default_indicator` (si es None, falta de columna = error). El resultado
+    sale en orden de clave (country, year, indicator) salvo que se pida `sort_by`.
+    """
+    if df is None or df.empty:
+        log.warning("DataFrame %s vacío", source)
+        return empty_long()
+
+    aliases = aliases or {}
+    with pd.option_context("mode.copy_on_write", True):
+        cols = {target: _pick_first_present(df, aliases.get(target, [target])) for target in LONG_COLUMNS}
+        missing = [
+            t for t, c in cols.items() if c is None and not (t == "indicator" and default_indicator is not None)
+        ]
+        if missing:
+            log.error("Faltan columnas esperadas en datos %s: %s", source, missing)
+            return empty_long()
+        if ARROW_BACKEND:
+            return _normalize_arrow(df, cols, default_indicator, sort_by)
+
+        out = _typed(df, cols, default_indicator)
+        if _use_parallel(len(out)):
+            from transform.parallel import mean_by_key_parallel
+
+            out = mean_by_key_parallel(out, TRANSFORM_WORKERS)
+        else:
+            out = _mean_by_key(_drop_nulls(out))
+        if sort_by:
+            out = out.sort_values(list(sort_by), ignore_index=True)
+        return out[LONG_COLUMNS]
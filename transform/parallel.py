@@ -0,0 +1,283 @@
+"""Deduplicación (media por clave) repartida por indicador en un pool de procesos.
+
+Se activa con TRANSFORM_WORKERS > 1 desde `transform.common.normalize_long`
+para frames de al menos TRANSFORM_PARALLEL_MIN_ROWS filas. Los datos viajan
+en bloques de memoria compartida (arrays numéricos: códigos de category, año,
+valor); a los procesos solo se les pasan nombres de bloque y metadatos.
+
+    1. El proceso principal ya tiene country/indicator como category con
+       etiquetas normalizadas y ordenadas (globales para todo el frame). Los
+       indicadores se cortan en rangos contiguos de códigos con un número de
+       filas parecido (particiones) y las columnas se copian tal cual al bloque
+       de entrada.
+    2. Cada proceso toma las filas de su partición, filtra nulos y promedia con
+       `_mean_by_key`; deja el resultado en su tramo del bloque intermedio y
+       devuelve cuántas claves tiene por celda (país, año).
+    3. Con esos recuentos el principal calcula el orden final (country, year,
+       indicator): por celda y, dentro de cada celda, por partición, que es el
+       orden de indicador porque las particiones son rangos contiguos.
+    4. Cada proceso rellena un tramo contiguo del bloque final (un rango de
+       celdas) leyendo esas posiciones del intermedio; el principal solo lo lee.
+
+Cada media se calcula con las mismas filas y en el mismo orden que en un solo
+proceso: el resultado es idéntico al serie y no depende del orden en que
+terminen los procesos. En serie quedan solo las copias de entrada y salida.
+"""
+
+from __future__ import annotations
+import atexit
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from transform.common import _drop_nulls, _mean_by_key
+from utils.logging import get_logger
+from utils.long_frame import VALUE_DTYPE, YEAR_DTYPE
+
+log = get_logger(__name__)
+
+# Particiones por proceso: más tramos que procesos equilibra la carga
+PARTITIONS_PER_WORKER = 2
+
+# Columnas de los bloques intermedio y final (resultado deduplicado)
+_RESULT_FIELDS = (("country", "<i4"), ("indicator", "<i4"), ("year", "<i2"), ("value", "<f8"))
+
+_LOCK = threading.Lock()
+_POOL: ProcessPoolExecutor | None = None
+_POOL_WORKERS = 0
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    """Pool reutilizado entre llamadas (arrancar procesos cuesta más que un transform pequeño)."""
+    global _POOL, _POOL_WORKERS
+    with _LOCK:
+        if _POOL is None or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                _POOL.shutdown()
+            method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(method))
+            _POOL_WORKERS = workers
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    """Detiene el pool y sus procesos (registrado con atexit; se puede llamar antes)."""
+    global _POOL, _POOL_WORKERS
+    with _LOCK:
+        if _POOL is not None:
+            _POOL.shutdown()
+            _POOL, _POOL_WORKERS = None, 0
+
+
+atexit.register(shutdown_pool)
+
+
+class _Block:
+    """Columnas de `n` filas en un bloque de memoria compartida (alineadas a 8 bytes)."""
+
+    def __init__(self, n: int, fields: tuple[tuple[str, str], ...], name: str | None = None):
+        self.n, self.fields = n, fields
+        self._offsets, size = {}, 0
+        for col, dtype in fields:
+            self._offsets[col] = size
+            size += -(-n * np.dtype(dtype).itemsize // 8) * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    @classmethod
+    def attach(cls, spec: tuple) -> "_Block":
+        name, n, fields = spec
+        return cls(n, fields, name)
+
+    @property
+    def spec(self) -> tuple:
+        return self.shm.name, self.n, self.fields
+
+    def views(self) -> dict[str, np.ndarray]:
+        """Arrays sobre el bloque: hay que soltarlos (del) antes de `close`."""
+        return {
+            col: np.ndarray(self.n, np.dtype(dtype), self.shm.buf, self._offsets[col]) for col, dtype in self.fields
+        }
+
+    def close(self, unlink: bool = False) -> None:
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _cell(country: np.ndarray, year: np.ndarray, y0: int, n_years: int) -> np.ndarray:
+    """Celda (país, año) de cada fila: country * n_years + (year - y0)."""
+    cell = country.astype(np.int64)
+    cell *= n_years
+    cell += year
+    cell -= y0
+    return cell
+
+
+def _dedupe_task(
+    in_spec: tuple,
+    mid_spec: tuple,
+    lo: int,
+    hi: int,
+    offset: int,
+    country_dtype: pd.CategoricalDtype,
+    indicator_dtype: pd.CategoricalDtype,
+    y0: int,
+    n_years: int,
+) -> np.ndarray:
+    """Media por clave de las filas con indicador en [lo, hi), escrita en el bloque intermedio desde `offset`.
+
+    Devuelve el nº de claves de cada celda (país, año).
+    """
+    src, mid = _Block.attach(in_spec), _Block.attach(mid_spec)
+    try:
+        cols = src.views()
+        rows = np.flatnonzero((cols["indicator"] >= lo) & (cols["indicator"] < hi))  # orden original
+        frame = pd.DataFrame({
+            "country": pd.Categorical.from_codes(cols["country"][rows], dtype=country_dtype),
+            "year": cols["year"][rows],
+            # Códigos locales 0..hi-lo: rango de claves denso para _mean_by_key
+            "indicator": pd.Categorical.from_codes(
+                cols["indicator"][rows] - lo, categories=indicator_dtype.categories[lo:hi]
+            ),
+            "value": cols["value"][rows],
+        })
+        del cols, rows
+        out = _mean_by_key(_drop_nulls(frame))
+        stop = offset + len(out)
+        res = mid.views()
+        res["country"][offset:stop] = out["country"].cat.codes
+        res["indicator"][offset:stop] = out["indicator"].cat.codes.to_numpy().astype(np.int32) + lo
+        res["year"][offset:stop] = out["year"].to_numpy()
+        res["value"][offset:stop] = out["value"].to_numpy()
+        cell = _cell(res["country"][offset:stop], res["year"][offset:stop], y0, n_years)
+        del res
+        return np.bincount(cell, minlength=len(country_dtype.categories) * n_years)
+    finally:
+        src.close()
+        mid.close()
+
+
+def _place_task(mid_spec: tuple, out_spec: tuple, dst: int, counts: np.ndarray, sources: np.ndarray) -> None:
+    """Rellena un tramo contiguo del bloque final (un rango de celdas) desde el intermedio.
+
+    `counts[p, c]` y `sources[p, c]`: nº de claves de la celda c en la
+    partición p y dónde empiezan en el bloque intermedio. El orden final es por
+    celda y, dentro de cada celda, por partición (= por indicador).
+    """
+    mid, out = _Block.attach(mid_spec), _Block.attach(out_spec)
+    try:
+        lengths, starts = counts.T.ravel(), sources.T.ravel()
+        total = int(lengths.sum())
+        seg_dst = np.cumsum(lengths) - lengths
+        idx = np.repeat(starts - seg_dst, lengths) + np.arange(total)
+        src, res = mid.views(), out.views()
+        for col, arr in src.items():
+            np.take(arr, idx, out=res[col][dst:dst + total])
+        del src, res
+    finally:
+        mid.close()
+        out.close()
+
+
+def _ranges(sizes: np.ndarray, n_parts: int) -> list[tuple[int, int]]:
+    """Cortes [lo, hi) de 0..len(sizes) con suma de `sizes` parecida (sin rangos vacíos)."""
+    cum = np.cumsum(sizes)
+    if not len(cum) or not cum[-1]:
+        return []
+    cuts = np.searchsorted(cum, cum[-1] * np.arange(1, n_parts) / n_parts, side="left") + 1
+    bounds = np.unique(np.concatenate([[0], np.minimum(cuts, len(cum)), [len(cum)]]))
+    return [
+        (int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if cum[hi - 1] > (cum[lo - 1] if lo else 0)
+    ]
+
+
+def mean_by_key_parallel(df: pd.DataFrame, workers: int) -> pd.DataFrame:
+    """`_mean_by_key(_drop_nulls(df))` repartido por indicador entre `workers` procesos.
+
+    `df` es la salida de `transform.common._typed` (country/indicator category,
+    year/value numéricos con nulos). Si el pool no está disponible se calcula en serie.
+    """
+    country_dtype, indicator_dtype = df["country"].dtype, df["indicator"].dtype
+    country_codes, indicator_codes = df["country"].cat.codes.to_numpy(), df["indicator"].cat.codes.to_numpy()
+    year = df["year"].to_numpy()
+    if year.dtype.kind not in "iuf":
+        year = df["year"].to_numpy(np.float64, na_value=np.nan)
+    sizes = np.bincount(indicator_codes[indicator_codes >= 0], minlength=len(indicator_dtype.categories))
+    ranges = _ranges(sizes, workers * PARTITIONS_PER_WORKER)
+    if len(ranges) < 2 or np.isnan(np.nanmax(year, initial=np.nan) if year.dtype.kind == "f" else 0):
+        return _mean_by_key(_drop_nulls(df))
+    y0 = int(np.nanmin(year))
+    n_years = int(np.nanmax(year)) - y0 + 1
+
+    n = len(df)
+    src = _Block(n, (
+        ("country", country_codes.dtype.str),
+        ("indicator", indicator_codes.dtype.str),
+        ("year", year.dtype.str),
+        ("value", np.dtype(VALUE_DTYPE).str),
+    ))
+    mid = _Block(n, _RESULT_FIELDS)
+    out = None
+    try:
+        cols = src.views()
+        cols["country"][:] = country_codes
+        cols["indicator"][:] = indicator_codes
+        cols["year"][:] = year
+        cols["value"][:] = df["value"].to_numpy(np.float64, na_value=np.nan)
+        del cols
+        # Tramo de cada partición en el bloque intermedio: tantas filas como tiene de entrada
+        offsets = np.cumsum([0] + [int(sizes[lo:hi].sum()) for lo, hi in ranges[:-1]]).astype(np.int64)
+
+        try:
+            pool = _pool(workers)
+            futures = [
+                pool.submit(
+                    _dedupe_task, src.spec, mid.spec, lo, hi, int(off), country_dtype, indicator_dtype, y0, n_years
+                )
+                for (lo, hi), off in zip(ranges, offsets)
+            ]
+            counts = np.vstack([f.result() for f in futures])
+            # Orden final: por celda y, dentro de cada celda, por partición. Cada
+            # proceso rellena un rango contiguo de celdas con nº de filas parecido.
+            sources = offsets[:, None] + np.cumsum(counts, axis=1) - counts
+            cum = np.cumsum(counts.sum(axis=0))
+            out = _Block(int(cum[-1]), _RESULT_FIELDS)
+            futures = [
+                pool.submit(
+                    _place_task, mid.spec, out.spec, int(cum[lo - 1]) if lo else 0,
+                    counts[:, lo:hi], sources[:, lo:hi],
+                )
+                for lo, hi in _ranges(counts.sum(axis=0), len(ranges))
+            ]
+            for f in futures:
+                f.result()
+        except Exception as e:  # p.ej. sin permisos para crear procesos
+            log.warning("Transformación en paralelo no disponible (%s); se calcula en serie", e)
+            return _mean_by_key(_drop_nulls(df))
+
+        res = out.views()
+        # astype/copy sacan los datos del bloque (se libera al salir); códigos ya validados
+        result = pd.DataFrame({
+            "country": pd.Categorical.from_codes(
+                res["country"].astype(country_codes.dtype), dtype=country_dtype, validate=False
+            ),
+            "year": res["year"].astype(YEAR_DTYPE),
+            "indicator": pd.Categorical.from_codes(
+                res["indicator"].astype(indicator_codes.dtype), dtype=indicator_dtype, validate=False
+            ),
+            "value": res["value"].copy(),
+        })
+        del res
+        return result
+    finally:
+        src.close(unlink=True)
+        mid.close(unlink=True)
+        if out is not None:
+            out.close(unlink=True)
@@ -3,7 +3,7 @@
 Objetivo: reducir ruido. Solo expone:
     - Rutas de trabajo (DATA_DIR, RAW_DIR, PROCESSED_DIR).
     - Variables de entorno de Postgres (sin validar aquí).
-    - Esquemas por defecto.
+    - Esquemas por defecto y ventana global de años (YEAR_MIN / YEAR_MAX opcional).
     - Helper `ensure_dirs()`.
 
 Si una variable es obligatoria se valida fuera (p.ej. al crear el engine).
@@ -41,6 +41,9 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "")
 DEFAULT_STAGING_SCHEMA = os.getenv("STAGING_SCHEMA", "staging")
 DEFAULT_MART_SCHEMA = os.getenv("MART_SCHEMA", "mart")
 
+YEAR_MIN = int(os.getenv("YEAR_MIN", "1990"))  # recorte inferior global de año
+YEAR_MAX = int(os.getenv("YEAR_MAX")) if os.getenv("YEAR_MAX") else None  # recorte superior (opcional)
+
 __all__ = [
     "DATA_DIR",
     "RAW_DIR",
@@ -51,4 +54,6 @@ __all__ = [
     "POSTGRES_PASSWORD",
     "DEFAULT_STAGING_SCHEMA",
     "DEFAULT_MART_SCHEMA",
+    "YEAR_MIN",
+    "YEAR_MAX",
 ]
@@ -1,54 +1,72 @@
+"""Conexión a Postgres: conversión JDBC → URL SQLAlchemy y registro de engines.
+
+`get_engine()` devuelve un único engine por proceso (uno por URL), creado en
+el primer uso con pool dimensionado y `pool_pre_ping`. Loaders, integraciones,
+run_log, marcas de agua y run_pipeline comparten así el pool: la conexión se
+abre una vez y se reutiliza en cada paso.
+
+Configuración (se lee al crear el engine, después de cargar .env):
+    DB_POOL_SIZE=5        conexiones persistentes del pool
+    DB_MAX_OVERFLOW=5     conexiones extra en picos (p.ej. PIPELINE_MODE=stream)
+    DB_POOL_TIMEOUT=30    segundos de espera por una conexión libre
+    DB_POOL_RECYCLE=1800  segundos antes de renovar una conexión
+"""
+
+from __future__ import annotations
 import os
+import threading
 from urllib.parse import urlparse
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 
-"""Conversión JDBC → URL SQLAlchemy y creación de engine Postgres.
+_LOCK = threading.Lock()
+_ENGINES: dict[str, Engine] = {}
 
-NOTA: hay un bloque duplicado al final (posible error de merge). No se elimina aquí por la restricción de no tocar lógica.
-"""
 
 def sqlalchemy_url_from_jdbc(jdbc_url: str, user: str, password: str) -> str:
-        """Convierte URL JDBC al formato psycopg2 aceptado por SQLAlchemy."""
-        parsed = urlparse(jdbc_url.replace("jdbc:", ""))
-        host = parsed.hostname or "localhost"
-        port = parsed.port or 5432
-        db   = parsed.path.lstrip("/") or "postgres"
-        return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
-
-def get_engine():
-    """Devuelve engine con pool_pre_ping; falla si faltan credenciales.
-
-    Lee credenciales del entorno y valida presencia. Usa pool_pre_ping para
-    evitar conexiones zombi y future=True para API 2.0.
-    """
+    """Convierte una URL JDBC en la forma aceptada por SQLAlchemy (psycopg2)."""
+    parsed = urlparse(jdbc_url.replace("jdbc:", ""))
+    host = parsed.hostname or "localhost"
+    port = parsed.port or 5432
+    db = parsed.path.lstrip("/") or "postgres"
+    return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
+
+
+def _env_url() -> str:
     jdbc = os.getenv("POSTGRES_URL")
     user = os.getenv("POSTGRES_USER")
-    pwd  = os.getenv("POSTGRES_PASSWORD")
+    pwd = os.getenv("POSTGRES_PASSWORD")
     if not jdbc or not user or not pwd:
         raise RuntimeError("Faltan POSTGRES_URL/USER/PASSWORD en el entorno")
+    return sqlalchemy_url_from_jdbc(jdbc, user, pwd)
 
-    url = sqlalchemy_url_from_jdbc(jdbc, user, pwd)
-    return create_engine(url, pool_pre_ping=True, future=True)
 
-def sqlalchemy_url_from_jdbc(jdbc_url: str, user: str, password: str) -> str:
-        """Convierte una URL JDBC en la forma aceptada por SQLAlchemy (psycopg2)."""
-        parsed = urlparse(jdbc_url.replace("jdbc:", ""))
-        host = parsed.hostname or "localhost"
-        port = parsed.port or 5432
-        db   = parsed.path.lstrip("/") or "postgres"
-        return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
-
-def get_engine():
-    """Devuelve un Engine SQLAlchemy configurado para Postgres.
-
-    Lee credenciales del entorno y valida presencia. Usa pool_pre_ping para
-    evitar conexiones zombi y future=True para API 2.0.
+def get_engine(url: str | None = None) -> Engine:
+    """Engine compartido del proceso (por defecto, el de POSTGRES_URL/USER/PASSWORD).
+
+    Se crea una sola vez por URL; falla si faltan credenciales.
     """
-    jdbc = os.getenv("POSTGRES_URL")
-    user = os.getenv("POSTGRES_USER")
-    pwd  = os.getenv("POSTGRES_PASSWORD")
-    if not jdbc or not user or not pwd:
-        raise RuntimeError("Faltan POSTGRES_URL/USER/PASSWORD en el entorno")
+    url = url or _env_url()
+    with _LOCK:
+        engine = _ENGINES.get(url)
+        if engine is None:
+            engine = create_engine(
+                url,
+                pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "5")),
+                pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+                pool_pre_ping=True,
+                future=True,
+            )
+            _ENGINES[url] = engine
+        return engine
+
 
-    url = sqlalchemy_url_from_jdbc(jdbc, user, pwd)
-    return create_engine(url, pool_pre_ping=True, future=True)
+def dispose_engines() -> None:
+    """Cierra los pools de todos los engines creados (p.ej. al final del proceso)."""
+    with _LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
@@ -0,0 +1,57 @@
+"""Huella estable del contenido de un DataFrame (detección de cambios entre ejecuciones).
+
+La huella no depende del orden de filas ni de columnas: se hashea cada fila
+con `pd.util.hash_pandas_object`, se ordenan los hashes y se resume todo con
+SHA-256 junto con los nombres de columna.
+"""
+
+from __future__ import annotations
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+def _row_hashes(df: pd.DataFrame, cols: list[str]) -> np.ndarray:
+    frame = df.set_axis([str(c) for c in df.columns], axis=1)[cols]
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def _digest(cols: list[str] | None, rows: np.ndarray | None) -> str:
+    h = hashlib.sha256()
+    if cols is None:
+        return h.hexdigest()
+    h.update("\x1f".join(cols).encode("utf-8"))
+    if rows is not None and len(rows):
+        h.update(np.sort(rows).tobytes())
+    return h.hexdigest()
+
+
+def frame_fingerprint(df: pd.DataFrame | None) -> str:
+    """SHA-256 hex del contenido de `df` (mismo valor para mismos datos en cualquier orden)."""
+    if df is None:
+        return _digest(None, None)
+    cols = sorted(map(str, df.columns))
+    return _digest(cols, _row_hashes(df, cols) if len(df) else None)
+
+
+class FrameFingerprint:
+    """Huella incremental por trozos: igual a `frame_fingerprint(pd.concat(trozos))`.
+
+    Solo se guardan los hashes de fila (8 bytes por fila), no los trozos.
+    """
+
+    def __init__(self):
+        self._cols: list[str] | None = None
+        self._rows: list[np.ndarray] = []
+
+    def update(self, df: pd.DataFrame | None) -> None:
+        if df is None:
+            return
+        if self._cols is None:
+            self._cols = sorted(map(str, df.columns))
+        if len(df):
+            self._rows.append(_row_hashes(df, self._cols))
+
+    def hexdigest(self) -> str:
+        return _digest(self._cols, np.concatenate(self._rows) if self._rows else None)
@@ -0,0 +1,291 @@
+"""Cliente HTTP compartido por los extractores (WHO, World Bank, SDMX).
+
+Una única `requests.Session` por proceso con pool keep-alive por host, de modo
+que el handshake TCP+TLS se paga una vez por host y no en cada petición.
+Además fija:
+    - Transferencia comprimida (Accept-Encoding: gzip, deflate).
+    - Timeouts uniformes (conexión / lectura) configurables por entorno.
+    - Contadores por host de peticiones, bytes y latencia (ver `stats()`).
+    - Limitador adaptativo por host y reintentos ante 429/5xx/errores de red
+      con backoff exponencial y Retry-After (`utils.ratelimit`).
+    - Caché persistente en disco con revalidación condicional (`utils.http_cache`).
+    - Copia cruda de cada respuesta en la zona de landing si hay ejecución activa (`utils.landing`).
+
+Uso:
+    from utils import http
+    data = http.get_json(url)
+"""
+
+from __future__ import annotations
+import os
+import random
+import threading
+import time
+from typing import Any, Iterable, Iterator
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import http_cache, landing, ratelimit
+from utils.logging import get_logger
+
+log = get_logger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))  # conexiones keep-alive por host
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "4"))  # reintentos por petición (0 = sin reintentos)
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1.0"))  # s; se dobla en cada intento
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "60"))
+
+# Estados transitorios: se reintentan y frenan el ritmo del host
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+USER_AGENT = "pharma-budget-impact-pipeline/1.0"
+
+_LOCK = threading.Lock()
+_SESSION: requests.Session | None = None
+_STATS: dict[str, dict[str, float]] = {}
+
+
+def get_session() -> requests.Session:
+    """Devuelve la sesión compartida (creación perezosa, segura entre hilos)."""
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers.update({
+                    "Accept-Encoding": "gzip, deflate",
+                    "User-Agent": USER_AGENT,
+                })
+                _SESSION = s
+    return _SESSION
+
+
+def _record(
+    host: str, wire_bytes: int, body_bytes: int, elapsed: float, error: bool, cached: bool = False, retry: bool = False,
+) -> None:
+    with _LOCK:
+        st = _STATS.setdefault(host, {
+            "requests": 0, "errors": 0, "retries": 0, "cache_hits": 0, "wire_bytes": 0, "body_bytes": 0,
+            "seconds": 0.0,
+        })
+        st["requests"] += 1
+        st["errors"] += int(error)
+        st["retries"] += int(retry)
+        st["cache_hits"] += int(cached)
+        st["wire_bytes"] += wire_bytes
+        st["body_bytes"] += body_bytes
+        st["seconds"] += elapsed
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True si el error es de red o un estado HTTP transitorio (429/5xx) ya agotados los reintentos."""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def _backoff(attempt: int) -> float:
+    """Espera exponencial con jitter completo: U(0, base·2^intento), acotada."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _send(url: str, host: str, **kwargs) -> tuple[requests.Response, float]:
+    """Petición con limitador del host y reintentos; devuelve (respuesta, segundos del último intento).
+
+    Ante 429/5xx o error de red se reduce el ritmo del host y se reintenta
+    (Retry-After si el servidor lo indica; si no, backoff exponencial). Tras
+    HTTP_RETRIES intentos fallidos se devuelve la última respuesta o se
+    relanza el último error.
+    """
+    limiter = ratelimit.get_limiter(host)
+    for attempt in range(HTTP_RETRIES + 1):
+        last = attempt == HTTP_RETRIES
+        limiter.acquire()
+        t0 = time.perf_counter()
+        try:
+            r = get_session().get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            limiter.on_throttle()
+            _record(host, 0, 0, time.perf_counter() - t0, error=True, retry=not last)
+            if last:
+                raise
+            wait = _backoff(attempt)
+            log.warning("GET %s: %s; reintento %d/%d en %.1f s", url, type(e).__name__, attempt + 1, HTTP_RETRIES, wait)
+            time.sleep(wait)
+            continue
+        except requests.RequestException:
+            _record(host, 0, 0, time.perf_counter() - t0, error=True)
+            raise
+        elapsed = time.perf_counter() - t0
+
+        if r.status_code not in RETRY_STATUS:
+            limiter.on_success()
+            return r, elapsed
+        retry_after = ratelimit.parse_retry_after(r.headers.get("Retry-After"))
+        limiter.on_throttle(retry_after)
+        if last:
+            return r, elapsed
+        _record(host, 0, 0, elapsed, error=True, retry=True)
+        r.close()
+        # Con Retry-After la espera la impone el limitador en el siguiente acquire()
+        wait = 0.0 if retry_after is not None else _backoff(attempt)
+        log.warning(
+            "GET %s -> %s; reintento %d/%d en %.1f s", url, r.status_code, attempt + 1, HTTP_RETRIES,
+            retry_after if retry_after is not None else wait,
+        )
+        time.sleep(wait)
+
+
+def get(url: str, *, timeout: float | tuple[float, float] | None = None, **kwargs) -> requests.Response:
+    """GET sobre la sesión compartida con timeout uniforme, limitador y reintentos por host.
+
+    Si la caché en disco está activa (ver `utils.http_cache`) y la petición no
+    es en streaming (para eso, `iter_body`), se sirve de disco mientras la entrada esté dentro del TTL
+    y, si no, se revalida con petición condicional (304 → disco).
+
+    No llama a `raise_for_status()`: el llamador decide cómo tratar el estado.
+    """
+    host = urlparse(url).netloc
+    t0 = time.perf_counter()
+    cache = None if kwargs.get("stream") else http_cache.get_cache()
+    entry = cache.lookup(url) if cache else None
+
+    if entry is not None and cache.is_fresh(entry):
+        r = cache.response(entry)
+        _record(host, 0, len(r.content), time.perf_counter() - t0, error=False, cached=True)
+        landing.save_raw(url, r.content)
+        return r
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry is not None:
+        headers.update(cache.conditional_headers(entry))
+    r, elapsed = _send(
+        url, host, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), headers=headers, **kwargs
+    )
+
+    if kwargs.get("stream"):
+        # El cuerpo aún no se ha leído: iter_body contabiliza la petición al consumirlo.
+        return r
+
+    if r.status_code == 304 and entry is not None:
+        cache.refresh(entry, r)
+        cached = cache.response(entry)
+        _record(host, 0, len(cached.content), elapsed, error=False, cached=True)
+        log.debug("GET %s -> 304 (revalidado, servido de caché) | %.0f ms", url, elapsed * 1000)
+        landing.save_raw(url, cached.content)
+        return cached
+
+    body = len(r.content)
+    try:
+        wire = int(r.raw.tell()) or body  # bytes comprimidos leídos del socket
+    except Exception:
+        wire = body
+    _record(host, wire, body, elapsed, error=r.status_code >= 400)
+    log.debug("GET %s -> %s | %d B (%d B wire) | %.0f ms", url, r.status_code, body, wire, elapsed * 1000)
+
+    if r.status_code == 200:
+        landing.save_raw(url, r.content)
+    if cache is not None and r.status_code == 200:
+        try:
+            cache.store(url, r)
+        except OSError as e:
+            log.warning("No se pudo guardar en caché HTTP %s: %s", url, e)
+    return r
+
+
+def _counted(
+    host: str, chunks: Iterable[bytes], elapsed: float, r: requests.Response | None = None, cached: bool = False,
+) -> Iterator[bytes]:
+    """Deja pasar los trozos y registra la petición con los bytes consumidos (también si se abandona).
+
+    Al terminar (o abandonarse) cierra `r`, que devuelve la conexión al pool del host.
+    """
+    body = 0
+    try:
+        for chunk in chunks:
+            body += len(chunk)
+            yield chunk
+    finally:
+        wire = 0
+        if r is not None:
+            try:
+                wire = int(r.raw.tell()) or body  # bytes comprimidos leídos del socket
+            except Exception:
+                wire = body
+            r.close()
+        _record(host, wire, body, elapsed, error=False, cached=cached)
+
+
+def iter_body(url: str, chunk_size: int = 1 << 16, **kwargs) -> Iterator[bytes]:
+    """GET en streaming: devuelve un iterador de trozos del cuerpo (descomprimido).
+
+    A diferencia de `get`, lanza `requests.HTTPError` antes de devolver el
+    iterador si el estado no es 2xx. Con caché activa, una entrada vigente (o
+    revalidada con 304) se lee de disco por trozos; si no, la respuesta se
+    descarga en streaming y se guarda en la caché y en landing según llega,
+    sin tener nunca el cuerpo entero en memoria.
+    """
+    host = urlparse(url).netloc
+    t0 = time.perf_counter()
+    cache = http_cache.get_cache()
+    entry = cache.lookup(url) if cache else None
+
+    if entry is None or not cache.is_fresh(entry):
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            headers.update(cache.conditional_headers(entry))
+        r, elapsed = _send(
+            url, host, timeout=kwargs.pop("timeout", None) or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+            headers=headers, stream=True, **kwargs,
+        )
+        if r.status_code != 304 or entry is None:
+            if r.status_code >= 400:
+                _record(host, 0, 0, elapsed, error=True)
+                r.close()
+            r.raise_for_status()
+            chunks = r.iter_content(chunk_size=chunk_size)
+            if cache is not None and r.status_code == 200:
+                chunks = cache.tee_store(url, r, chunks)
+            return _counted(host, landing.tee_raw(url, chunks), elapsed, r)
+        r.close()
+        cache.refresh(entry, r)
+        log.debug("GET %s -> 304 (revalidado, servido de caché) | %.0f ms", url, elapsed * 1000)
+    chunks = cache.iter_body(entry, chunk_size)
+    return _counted(host, landing.tee_raw(url, chunks), time.perf_counter() - t0, cached=True)
+
+
+def get_json(url: str, **kwargs) -> Any:
+    """GET + raise_for_status + JSON decodificado."""
+    r = get(url, **kwargs)
+    r.raise_for_status()
+    return r.json()
+
+
+def stats() -> dict[str, dict[str, float]]:
+    """Copia de los contadores acumulados por host."""
+    with _LOCK:
+        return {h: dict(v) for h, v in _STATS.items()}
+
+
+def reset_stats() -> None:
+    with _LOCK:
+        _STATS.clear()
+
+
+def log_stats() -> None:
+    """Resumen por host en el log (una línea por host)."""
+    for host, st in sorted(stats().items()):
+        n = st["requests"] or 1
+        log.info(
+            "HTTP %s: %d peticiones (%d errores, %d reintentos, %d de caché) | %.1f MB cuerpo / %.1f MB red "
+            "| latencia media %.0f ms | ritmo final %.1f req/s",
+            host, st["requests"], st["errors"], st["retries"], st["cache_hits"], st["body_bytes"] / 1e6,
+            st["wire_bytes"] / 1e6, st["seconds"] / n * 1000, ratelimit.rates().get(host, 0.0),
+        )
@@ -0,0 +1,210 @@
+"""Caché HTTP persistente en disco (bajo RAW_DIR) con revalidación condicional.
+
+Clave = URL completa (sha256). Por cada entrada se guardan dos ficheros:
+    <hash>.body.gz  cuerpo de la respuesta comprimido
+    <hash>.json     metadatos: url, ETag, Last-Modified, stored_at, tamaño...
+
+Política:
+    - Entrada más joven que el TTL → se sirve de disco sin tocar la red.
+    - Entrada caducada → petición condicional (If-None-Match / If-Modified-Since);
+      un 304 renueva la entrada y se sirve de disco.
+    - Tamaño total acotado: al superarlo se eliminan las entradas usadas hace
+      más tiempo (LRU por mtime del cuerpo, que se actualiza en cada lectura).
+"""
+
+from __future__ import annotations
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils.config import RAW_DIR
+from utils.logging import get_logger
+
+log = get_logger(__name__)
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE", "1") == "1"
+HTTP_CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", str(RAW_DIR / "http_cache"))).resolve()
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", str(24 * 3600)))  # segundos
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "512"))
+
+# Cabeceras de la respuesta original que se conservan con la entrada
+_KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class HttpCache:
+    """Caché URL → respuesta con TTL, validadores HTTP y expulsión LRU por tamaño."""
+
+    def __init__(self, directory: Path, ttl: int, max_bytes: int):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        h = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / f"{h}.body.gz", self.directory / f"{h}.json"
+
+    def lookup(self, url: str) -> dict | None:
+        """Metadatos de la entrada o None si no existe (o está incompleta)."""
+        body, meta = self._paths(url)
+        try:
+            entry = json.loads(meta.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if not body.exists():
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return (time.time() - entry.get("stored_at", 0)) < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict[str, str]:
+        headers = {}
+        if entry["headers"].get("ETag"):
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    def response(self, entry: dict) -> requests.Response:
+        """Reconstruye un `requests.Response` 200 desde disco (marca uso LRU)."""
+        body, _ = self._paths(entry["url"])
+        content = gzip.decompress(body.read_bytes())
+        os.utime(body)
+        r = requests.Response()
+        r.status_code = 200
+        r.reason = "OK"
+        r.url = entry["url"]
+        r.headers = CaseInsensitiveDict(entry["headers"])
+        r._content = content
+        return r
+
+    def iter_body(self, entry: dict, chunk_size: int) -> Iterator[bytes]:
+        """Cuerpo de una entrada leído de disco por trozos, sin cargarlo entero (marca uso LRU)."""
+        body, _ = self._paths(entry["url"])
+        os.utime(body)
+        with gzip.open(body, "rb") as fh:
+            while chunk := fh.read(chunk_size):
+                yield chunk
+
+    def tee_store(self, url: str, resp: requests.Response, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Deja pasar los trozos de una respuesta 200 guardándolos a la vez en la caché.
+
+        El cuerpo se comprime a un temporal según llega; la entrada solo se
+        publica si se lee completo. Un fallo de disco no corta la descarga.
+        """
+        body, meta = self._paths(url)
+        tmp_body = body.with_suffix(f".{threading.get_ident()}.{time.monotonic_ns()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fh = gzip.open(tmp_body, "wb", compresslevel=5)
+        except OSError as e:
+            log.warning("No se pudo guardar en caché HTTP %s: %s", url, e)
+            yield from chunks
+            return
+        complete = False
+        try:
+            for chunk in chunks:
+                if fh is not None:
+                    try:
+                        fh.write(chunk)
+                    except OSError as e:
+                        log.warning("No se pudo guardar en caché HTTP %s: %s", url, e)
+                        fh.close()
+                        fh = None
+                yield chunk
+            complete = fh is not None
+        finally:
+            if fh is not None:
+                fh.close()
+            if not complete:
+                tmp_body.unlink(missing_ok=True)
+        try:
+            os.replace(tmp_body, body)
+            self._write_meta(meta, self._entry(url, resp, body.stat().st_size))
+            self._evict()
+        except OSError as e:
+            log.warning("No se pudo guardar en caché HTTP %s: %s", url, e)
+
+    @staticmethod
+    def _entry(url: str, resp: requests.Response, size: int) -> dict:
+        return {
+            "url": url,
+            "stored_at": time.time(),
+            "size": size,
+            "headers": {k: resp.headers[k] for k in _KEPT_HEADERS if k in resp.headers},
+        }
+
+    def store(self, url: str, resp: requests.Response) -> None:
+        """Guarda una respuesta 200 (escritura atómica) y aplica la cota de tamaño."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        body, meta = self._paths(url)
+        payload = gzip.compress(resp.content, compresslevel=5)
+        entry = self._entry(url, resp, len(payload))
+        tmp_body = body.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_body.write_bytes(payload)
+        os.replace(tmp_body, body)
+        self._write_meta(meta, entry)
+        self._evict()
+
+    def refresh(self, entry: dict, resp: requests.Response) -> None:
+        """Tras un 304: renueva stored_at y actualiza validadores si el servidor envía nuevos."""
+        _, meta = self._paths(entry["url"])
+        entry["stored_at"] = time.time()
+        for k in ("ETag", "Last-Modified"):
+            if k in resp.headers:
+                entry["headers"][k] = resp.headers[k]
+        self._write_meta(meta, entry)
+
+    @staticmethod
+    def _write_meta(meta: Path, entry: dict) -> None:
+        tmp_meta = meta.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_meta.write_text(json.dumps(entry), encoding="utf-8")
+        os.replace(tmp_meta, meta)
+
+    def _evict(self) -> None:
+        """Elimina las entradas menos recientemente usadas hasta caber en max_bytes."""
+        with self._lock:
+            bodies = []
+            for p in self.directory.glob("*.body.gz"):
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                bodies.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in bodies)
+            if total <= self.max_bytes:
+                return
+            for _, size, p in sorted(bodies):
+                meta = p.with_name(p.name.replace(".body.gz", ".json"))
+                for f in (meta, p):
+                    try:
+                        f.unlink()
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                log.debug("Caché HTTP: expulsada %s", p.name)
+                if total <= self.max_bytes:
+                    break
+
+
+_CACHE: HttpCache | None = None
+
+
+def get_cache() -> HttpCache | None:
+    """Caché compartida del proceso; None si HTTP_CACHE=0."""
+    global _CACHE
+    if not HTTP_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        _CACHE = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_TTL, HTTP_CACHE_MAX_MB * 1024 * 1024)
+    return _CACHE
@@ -0,0 +1,86 @@
+"""Lectura incremental de arrays JSON grandes (p.ej. `{"value": [ {...}, ... ]}`).
+
+En lugar de `r.json()` (que materializa el documento entero como objetos
+Python) se decodifica el array elemento a elemento a partir de trozos de
+bytes, de modo que el llamador puede quedarse solo con los campos que
+necesita y descartar el resto según llegan.
+"""
+
+from __future__ import annotations
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator
+
+_WS = re.compile(r"[\s,]*")
+_ITEM_END = re.compile(r"\s*[,\]]")  # lo que debe seguir a un elemento completo
+_COMPACT_AT = 1 << 16  # recorta el buffer cuando lo consumido supera 64 KB
+
+
+def iter_array_items(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """Genera los elementos del array asociado a `key` en un objeto JSON.
+
+    `chunks` son trozos de bytes UTF-8 en orden (p.ej. `r.iter_content()`).
+    Si la clave no aparece se termina sin generar nada.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    it = iter(chunks)
+    buf = ""
+    pos = None  # posición tras '[' una vez localizado el array
+
+    def _more() -> bool:
+        nonlocal buf
+        for chunk in it:
+            if chunk:
+                buf += utf8.decode(chunk)
+                return True
+        return False
+
+    # 1) Localizar el inicio del array
+    while pos is None:
+        m = start.search(buf)
+        if m:
+            pos = m.end()
+            break
+        if not _more():
+            return
+
+    # 2) Decodificar elementos uno a uno
+    while True:
+        pos = _WS.match(buf, pos).end()
+        if pos >= len(buf):
+            if not _more():
+                raise ValueError(f"JSON truncado dentro del array '{key}'")
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Elemento incompleto: pedir más bytes y reintentar
+            if not _more():
+                raise
+            continue
+        if not _ITEM_END.match(buf, end):
+            # Sin ',' o ']' detrás el elemento puede seguir en el siguiente trozo
+            # (un número: "12" + "34" → 1234, "5.5" + "e3"): se decodifica de nuevo.
+            if not _more():
+                raise ValueError(f"JSON truncado dentro del array '{key}'")
+            continue
+        yield item
+        pos = end
+        if pos > _COMPACT_AT:
+            buf = buf[pos:]
+            pos = 0
+
+
+if __name__ == "__main__":
+    # Comprobación rápida: elementos partidos en cualquier punto entre trozos
+    doc = b'{"value": [1234, -5.5e3, "a,b]\\"c", {"k": [1, 2]}, true, null]}'
+    expected = json.loads(doc)["value"]
+    for cut in range(1, len(doc)):
+        assert list(iter_array_items([doc[:cut], doc[cut:]], "value")) == expected, cut
+    assert list(iter_array_items([bytes([b]) for b in doc], "value")) == expected
+    print("json_stream OK")
@@ -0,0 +1,255 @@
+"""Zona de aterrizaje (landing) bajo RAW_DIR, particionada por fuente y ejecución.
+
+Estructura:
+    RAW_DIR/source=<fuente>/run=<run_id>/raw/<sha256>.gz   respuestas HTTP crudas (gzip)
+    RAW_DIR/source=<fuente>/run=<run_id>/raw/index.jsonl   url → fichero
+    RAW_DIR/source=<fuente>/run=<run_id>/long.parquet      extracto normalizado (formato largo)
+
+`run_id` es el instante UTC de la extracción (p.ej. 20250301T120000Z), de modo
+que `--replay <run_id|latest>` puede reconstruir transform/load sin red. Al
+empezar cada ejecución se conservan solo las LANDING_KEEP_RUNS anteriores de
+cada fuente (0 = sin límite).
+
+Uso:
+    run_id = landing.start_run()          # activa la captura de respuestas crudas
+    landing.save_frame("who", run_id, df)
+    with landing.frame_writer("who", run_id) as w:   # por trozos (PIPELINE_MODE=stream)
+        w.write(chunk)
+    df = landing.load_frame("who", landing.resolve_run("latest"))
+"""
+
+from __future__ import annotations
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.config import RAW_DIR
+from utils.logging import get_logger
+from utils.long_frame import ARROW_BACKEND, LONG_COLUMNS, LONG_SCHEMA
+
+log = get_logger(__name__)
+
+LANDING_ENABLED = os.getenv("LANDING", "1") == "1"
+LANDING_DIR = Path(os.getenv("LANDING_DIR", str(RAW_DIR))).resolve()
+LANDING_COMPRESSION = os.getenv("LANDING_COMPRESSION", "zstd")  # compresión parquet
+# Ejecuciones anteriores que se conservan por fuente al empezar una nueva (0 = todas)
+LANDING_KEEP_RUNS = int(os.getenv("LANDING_KEEP_RUNS", "10"))
+
+RUN_ID_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# Host de cada API → fuente (mismos nombres que los prefijos del pipeline);
+# sigue a las URL base configurables de los extractores
+SOURCE_HOSTS = {
+    urlparse(os.getenv("GHO_BASE_URL", "https://ghoapi.azureedge.net/api")).netloc: "who",
+    urlparse(os.getenv("WB_BASE_URL", "https://api.worldbank.org/v2")).netloc: "worldbank",
+    urlparse(os.getenv("SDMX_BASE_URL", "https://sdmx.oecd.org/public/rest")).netloc: "sdmx",
+}
+
+_LOCK = threading.Lock()
+_RUN_ID: str | None = None
+
+
+def new_run_id(ts: datetime | None = None) -> str:
+    return (ts or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime(RUN_ID_FORMAT)
+
+
+def run_timestamp(run_id: str) -> datetime:
+    """Instante UTC de extracción codificado en el run_id."""
+    return datetime.strptime(run_id, RUN_ID_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def start_run(run_id: str | None = None) -> str | None:
+    """Activa la captura de respuestas crudas para esta ejecución; None si LANDING=0."""
+    global _RUN_ID
+    if not LANDING_ENABLED:
+        return None
+    _RUN_ID = run_id or new_run_id()
+    log.info("Landing activo: run=%s en %s", _RUN_ID, LANDING_DIR)
+    prune_runs(LANDING_KEEP_RUNS, exclude=_RUN_ID)
+    return _RUN_ID
+
+
+def prune_runs(keep: int, exclude: str | None = None) -> int:
+    """Borra, por fuente, las ejecuciones más antiguas salvo las `keep` más recientes.
+
+    `exclude` (la ejecución en curso) no cuenta ni se borra; keep <= 0 no borra
+    nada. Devuelve el nº de directorios eliminados.
+    """
+    if keep <= 0:
+        return 0
+    removed = 0
+    for source_dir in LANDING_DIR.glob("source=*"):
+        runs = sorted(p for p in source_dir.glob("run=*") if p.is_dir() and p.name != f"run={exclude}")
+        for old in runs[:-keep]:
+            try:
+                shutil.rmtree(old)
+                removed += 1
+            except OSError as e:
+                log.warning("No se pudo borrar la ejecución de landing %s: %s", old, e)
+    if removed:
+        log.info("Landing: %d ejecuciones antiguas eliminadas (LANDING_KEEP_RUNS=%d)", removed, keep)
+    return removed
+
+
+def current_run() -> str | None:
+    return _RUN_ID
+
+
+def run_dir(source: str, run_id: str) -> Path:
+    return LANDING_DIR / f"source={source}" / f"run={run_id}"
+
+
+def _source_of(url: str) -> str | None:
+    return SOURCE_HOSTS.get(urlparse(url).netloc)
+
+
+def _raw_paths(url: str) -> tuple[Path, Path] | None:
+    source = _source_of(url)
+    if _RUN_ID is None or source is None:
+        return None
+    raw = run_dir(source, _RUN_ID) / "raw"
+    raw.mkdir(parents=True, exist_ok=True)
+    return raw / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.gz", raw / "index.jsonl"
+
+
+def _index(index: Path, url: str, body: Path) -> None:
+    with _LOCK, index.open("a", encoding="utf-8") as fh:
+        fh.write(json.dumps({"url": url, "file": body.name}) + "\n")
+
+
+def save_raw(url: str, content: bytes) -> None:
+    """Guarda el cuerpo crudo de una respuesta si hay ejecución activa y la URL es de una fuente."""
+    paths = _raw_paths(url)
+    if paths is None:
+        return
+    body, index = paths
+    try:
+        body.write_bytes(gzip.compress(content, compresslevel=5))
+        _index(index, url, body)
+    except OSError as e:
+        log.warning("No se pudo guardar respuesta cruda %s: %s", url, e)
+
+
+def tee_raw(url: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Deja pasar los trozos de una descarga en streaming escribiéndolos a la vez en gzip."""
+    paths = _raw_paths(url)
+    if paths is None:
+        yield from chunks
+        return
+    body, index = paths
+    with gzip.open(body, "wb", compresslevel=5) as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+            yield chunk
+    _index(index, url, body)
+
+
+def save_frame(source: str, run_id: str | None, df: pd.DataFrame) -> Path | None:
+    """Escribe el extracto normalizado como parquet comprimido; None si no hay run."""
+    if run_id is None or df is None:
+        return None
+    path = run_dir(source, run_id) / "long.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    df.to_parquet(tmp, compression=LANDING_COMPRESSION, index=False)
+    os.replace(tmp, path)
+    log.info("Landing %s: %s filas en %s", source, len(df), path)
+    return path
+
+
+class _FrameWriter:
+    """Escritor parquet por trozos con el esquema del formato largo.
+
+    Un fallo de escritura no corta el pipeline: se avisa y el fichero se descarta.
+    """
+
+    def __init__(self, source: str, writer: pq.ParquetWriter | None):
+        self.source = source
+        self._writer = writer
+        self.failed = False
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self._writer is None or df is None or df.empty:
+            return
+        try:
+            table = pa.Table.from_pandas(df[LONG_COLUMNS], preserve_index=False)
+            self._writer.write_table(table.cast(LONG_SCHEMA).replace_schema_metadata(None))
+            self.rows += len(df)
+        except Exception as e:
+            log.warning("No se pudo guardar el extracto %s en landing: %s", self.source, e)
+            self.failed = True
+            self.close()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+@contextmanager
+def frame_writer(source: str, run_id: str | None) -> Iterator[_FrameWriter]:
+    """Extracto normalizado escrito por trozos (mismo fichero que save_frame).
+
+    El parquet solo aparece si se cierra sin error; sin run no escribe nada.
+    """
+    if run_id is None:
+        yield _FrameWriter(source, None)
+        return
+    path = run_dir(source, run_id) / "long.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    frames = _FrameWriter(source, pq.ParquetWriter(tmp, LONG_SCHEMA, compression=LANDING_COMPRESSION))
+    try:
+        yield frames
+    except BaseException:
+        frames.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    frames.close()
+    if frames.failed:
+        tmp.unlink(missing_ok=True)
+        return
+    os.replace(tmp, path)
+    log.info("Landing %s: %s filas en %s", source, frames.rows, path)
+
+
+def load_frame(source: str, run_id: str) -> pd.DataFrame:
+    """Lee el extracto normalizado de una ejecución (FileNotFoundError si no existe)."""
+    path = run_dir(source, run_id) / "long.parquet"
+    if not path.exists():
+        raise FileNotFoundError(f"No hay extracto en landing para {source} run={run_id} ({path})")
+    if ARROW_BACKEND:
+        return pd.read_parquet(path, dtype_backend="pyarrow")
+    return pd.read_parquet(path)
+
+
+def list_runs(source: str | None = None) -> list[str]:
+    """run_ids con extracto normalizado (de una fuente o de todas), en orden cronológico."""
+    pattern = f"source={source}/run=*/long.parquet" if source else "source=*/run=*/long.parquet"
+    return sorted({p.parent.name.removeprefix("run=") for p in LANDING_DIR.glob(pattern)})
+
+
+def resolve_run(run: str, sources: Iterable[str] = ()) -> str:
+    """'latest' → última ejecución con extracto de todas las `sources`; otro valor tal cual."""
+    if run != "latest":
+        return run
+    runs = set(list_runs())
+    for source in sources:
+        runs &= set(list_runs(source))
+    runs = sorted(runs)
+    if not runs:
+        raise FileNotFoundError(f"No hay ejecuciones en la zona de landing ({LANDING_DIR})")
+    return runs[-1]
@@ -0,0 +1,128 @@
+"""Tipos compactos del formato largo estándar (country, year, indicator, value).
+
+    country / indicator → category (códigos enteros + tabla de etiquetas ordenada)
+    year                → int16
+    value               → float64 (float32 no basta: el PIB en USD necesita >7 cifras)
+
+Con cientos de países y miles de indicadores el frame ocupa varias veces menos
+y los groupby trabajan sobre códigos enteros (`observed=True`). Las categorías
+se guardan ordenadas, así que ordenar por ellas da el mismo orden que con texto.
+
+Modo Arrow (opt-in, PANDAS_DTYPE_BACKEND=pyarrow): columnas respaldadas por
+Arrow (string[pyarrow], int16[pyarrow], double[pyarrow]). Los extractores las
+construyen directamente, las transformaciones operan con pyarrow.compute y los
+loaders escriben los buffers Arrow sin pasar por objetos Python.
+
+Uso:
+    df = compact_long(df)                                   # salida de extractores
+    s = as_category(df["country"], lambda s: s.str.upper())  # normaliza solo los valores distintos
+"""
+
+from __future__ import annotations
+import os
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# "numpy" (category/int16/float64, por defecto) o "pyarrow"
+DTYPE_BACKEND = os.getenv("PANDAS_DTYPE_BACKEND", "numpy").strip().lower()
+ARROW_BACKEND = DTYPE_BACKEND == "pyarrow"
+
+LONG_COLUMNS = ["country", "year", "indicator", "value"]
+YEAR_DTYPE = "int16"
+VALUE_DTYPE = "float64"
+
+# Esquema Arrow del formato largo
+LONG_SCHEMA = pa.schema([
+    ("country", pa.string()),
+    ("year", pa.int16()),
+    ("indicator", pa.string()),
+    ("value", pa.float64()),
+])
+
+
+def arrow_long(table: pa.Table) -> pd.DataFrame:
+    """Tabla Arrow (LONG_SCHEMA) → DataFrame con columnas Arrow, sin copiar buffers."""
+    return table.select(LONG_COLUMNS).cast(LONG_SCHEMA).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def to_arrow(values, type_: pa.DataType) -> pa.Array | pa.ChunkedArray:
+    """Columna pandas (Arrow, category o numpy) → array Arrow del tipo pedido."""
+    arr = values.array if isinstance(values, pd.Series) else values
+    if isinstance(arr, pd.Categorical):
+        # Diccionario (códigos + etiquetas) → texto, en código nativo
+        arr = pa.DictionaryArray.from_arrays(
+            pa.array(arr.codes, mask=arr.codes < 0), pa.array(arr.categories.astype(str), pa.string())
+        )
+        return arr.cast(type_)
+    if not isinstance(arr, (pa.Array, pa.ChunkedArray)):
+        arr = pa.array(arr, from_pandas=True)  # columnas Arrow: sin copia (__arrow_array__)
+    return arr.cast(type_)
+
+
+def numeric_arrow(values, type_: pa.DataType = pa.float64()) -> pa.Array | pa.ChunkedArray:
+    """`pd.to_numeric(errors="coerce")` → array Arrow del tipo pedido (NaN → nulo)."""
+    arr = to_arrow(pd.to_numeric(values, errors="coerce"), pa.float64())
+    arr = pc.if_else(pc.is_nan(arr), pa.scalar(None, pa.float64()), arr)
+    return arr.cast(type_)
+
+
+def empty_long() -> pd.DataFrame:
+    """Frame largo vacío con los tipos compactos."""
+    if ARROW_BACKEND:
+        return arrow_long(LONG_SCHEMA.empty_table())
+    return pd.DataFrame({
+        "country": pd.Categorical([]),
+        "year": pd.Series([], dtype=YEAR_DTYPE),
+        "indicator": pd.Categorical([]),
+        "value": pd.Series([], dtype=VALUE_DTYPE),
+    })
+
+
+def as_category(values, normalize: Callable[[pd.Series], pd.Series] | None = None) -> pd.Categorical:
+    """Convierte a category con etiquetas de texto ordenadas; nulos → NaN.
+
+    `normalize` (p.ej. strip/upper) se aplica a las etiquetas distintas y no a
+    cada fila; si dos etiquetas coinciden tras normalizar se funden en una.
+    """
+    s = pd.Series(values, copy=False)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes, uniques = s.cat.codes.to_numpy(), s.cat.categories
+    else:
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    labels = pd.Series(pd.Index(uniques).astype(str), dtype=object)
+    if normalize is not None:
+        labels = normalize(labels.astype("string")).astype(object)
+    categories = pd.Index(labels.unique()).sort_values()
+    remap = categories.get_indexer(labels)
+    new_codes = np.where(codes >= 0, remap[codes] if len(remap) else codes, -1)
+    return pd.Categorical.from_codes(new_codes, categories=categories)
+
+
+def compact_long(df: pd.DataFrame) -> pd.DataFrame:
+    """Frame largo con tipos compactos; descarta filas sin año (no representables en int16)."""
+    if df is None or df.empty:
+        return empty_long()
+    if ARROW_BACKEND:
+        table = pa.table({
+            "country": to_arrow(df["country"], pa.string()),
+            "year": numeric_arrow(df["year"], pa.int16()),
+            "indicator": to_arrow(df["indicator"], pa.string()),
+            "value": numeric_arrow(df["value"]),
+        })
+        return arrow_long(table.filter(pc.is_valid(table["year"])))
+    year = pd.to_numeric(df["year"], errors="coerce")
+    keep = year.notna()
+    out = pd.DataFrame({
+        "country": as_category(df["country"]),
+        "year": year,
+        "indicator": as_category(df["indicator"]),
+        "value": pd.to_numeric(df["value"], errors="coerce").astype(VALUE_DTYPE),
+    }, index=df.index)
+    if not keep.all():
+        out = out[keep.to_numpy()]
+    out["year"] = out["year"].astype(YEAR_DTYPE)
+    return out.reset_index(drop=True)
@@ -0,0 +1,113 @@
+"""Limitador de peticiones por host: token bucket con ajuste AIMD y soporte de Retry-After.
+
+Cada host tiene un cubo de fichas que se rellena a `rate` peticiones/s (con
+ráfagas de hasta `burst`). El ritmo se adapta a la respuesta del servidor:
+    - Respuesta correcta        → aumento aditivo (+HTTP_RATE_STEP), hasta HTTP_RATE_MAX.
+    - 429 / 5xx / error de red  → reducción multiplicativa (×HTTP_RATE_BACKOFF), hasta HTTP_RATE_MIN.
+    - Cabecera Retry-After      → el host queda bloqueado hasta ese instante.
+
+Uso:
+    limiter = get_limiter(host)
+    limiter.acquire()          # bloquea hasta que haya ficha
+    ...
+    limiter.on_success() / limiter.on_throttle(retry_after)
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from utils.logging import get_logger
+
+log = get_logger(__name__)
+
+HTTP_RATE = float(os.getenv("HTTP_RATE", "8"))            # ritmo inicial (peticiones/s por host)
+HTTP_RATE_MIN = float(os.getenv("HTTP_RATE_MIN", "0.5"))
+HTTP_RATE_MAX = float(os.getenv("HTTP_RATE_MAX", "32"))
+HTTP_RATE_STEP = float(os.getenv("HTTP_RATE_STEP", "0.5"))  # aumento aditivo por respuesta correcta
+HTTP_RATE_BACKOFF = float(os.getenv("HTTP_RATE_BACKOFF", "0.5"))  # factor multiplicativo ante 429/5xx
+HTTP_BURST = int(os.getenv("HTTP_BURST", "8"))
+
+
+class TokenBucket:
+    """Cubo de fichas seguro entre hilos con ritmo adaptativo (AIMD)."""
+
+    def __init__(self, host: str, rate: float, burst: int, min_rate: float, max_rate: float):
+        self.host = host
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Consume una ficha, esperando lo necesario (incluido un Retry-After pendiente)."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + HTTP_RATE_STEP)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        """429/5xx o error de red: reduce el ritmo y vacía el cubo; respeta Retry-After."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * HTTP_RATE_BACKOFF)
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, self.updated + retry_after)
+            rate = self.rate
+        log.debug("Limitador %s: ritmo reducido a %.2f req/s (Retry-After=%s)", self.host, rate, retry_after)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After en segundos (admite número o fecha HTTP); None si falta o es inválido."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+_LOCK = threading.Lock()
+_LIMITERS: dict[str, TokenBucket] = {}
+
+
+def get_limiter(host: str) -> TokenBucket:
+    """Limitador compartido del host (creación perezosa)."""
+    with _LOCK:
+        limiter = _LIMITERS.get(host)
+        if limiter is None:
+            limiter = _LIMITERS[host] = TokenBucket(host, HTTP_RATE, HTTP_BURST, HTTP_RATE_MIN, HTTP_RATE_MAX)
+        return limiter
+
+
+def rates() -> dict[str, float]:
+    """Ritmo actual (req/s) de cada host."""
+    with _LOCK:
+        return {host: lim.rate for host, lim in _LIMITERS.items()}
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import os
 import traceback
+import weakref
 from contextlib import contextmanager
 from sqlalchemy import text
 
@@ -27,6 +28,9 @@ CREATE TABLE IF NOT EXISTS {STAGING}.run_log (
   error_msg TEXT
 );"""
 
+# Huella del contenido procesado por el paso (detección de cambios entre ejecuciones)
+ALTER_TABLE_RUNLOG = f"ALTER TABLE {STAGING}.run_log ADD COLUMN IF NOT EXISTS fingerprint TEXT;"
+
 INSERT_SQL = (
     f"INSERT INTO {STAGING}.run_log (step, start_ts, status) "
     f"VALUES (:step, NOW(), 'OK') RETURNING id;"
@@ -40,12 +44,19 @@ UPDATE_ERR = (
     f"WHERE id=:id;"
 )
 
+# Engines en los que ya se ha asegurado la tabla (una vez por engine y proceso)
+_ENSURED = weakref.WeakSet()
+
 def ensure_run_log_table(engine):
-    """Crea esquema y tabla si faltan (idempotente)."""
+    """Crea esquema y tabla si faltan (idempotente; solo consulta la BD la primera vez por engine)."""
+    if engine in _ENSURED:
+        return
     with engine.begin() as conn:
         conn.execute(text(CREATE_SCHEMA_STAGING))
     with engine.begin() as conn:
         conn.execute(text(CREATE_TABLE_RUNLOG))
+        conn.execute(text(ALTER_TABLE_RUNLOG))
+    _ENSURED.add(engine)
 
 @contextmanager
 def step_run(engine, step: str, rows_in: int | None = None):
@@ -70,4 +81,33 @@ def set_rows_out(engine, run_id: int, rows_out: int | None):
         conn.execute(
             text(f"UPDATE {STAGING}.run_log SET rows_out=:rout WHERE id=:id"),
             {"id": run_id, "rout": rows_out},
-        )
\ No newline at end of file
+        )
+
+def set_fingerprint(engine, run_id: int, fingerprint: str | None):
+    """Guarda la huella de contenido del paso (ver utils.fingerprint)."""
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"UPDATE {STAGING}.run_log SET fingerprint=:fp WHERE id=:id"),
+            {"id": run_id, "fp": fingerprint},
+        )
+
+def last_fingerprint(engine, step: str) -> str | None:
+    """Huella del último paso `step` terminado en OK (None si no hay)."""
+    with engine.begin() as conn:
+        return conn.execute(
+            text(
+                f"SELECT fingerprint FROM {STAGING}.run_log "
+                f"WHERE step=:step AND status='OK' AND end_ts IS NOT NULL "
+                f"ORDER BY id DESC LIMIT 1"
+            ),
+            {"step": step},
+        ).scalar()
+
+def last_step_ok(engine, step: str) -> bool:
+    """True si la última ejecución registrada de `step` terminó en OK."""
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(f"SELECT status, end_ts FROM {STAGING}.run_log WHERE step=:step ORDER BY id DESC LIMIT 1"),
+            {"step": step},
+        ).first()
+    return row is not None and row[0] == "OK" and row[1] is not None
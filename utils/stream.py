@@ -0,0 +1,81 @@
+"""Etapas encadenadas por colas acotadas (pipeline extract → transform → load).
+
+`staged(items, fn)` consume `items` y aplica `fn` en un hilo propio, dejando
+los resultados en una cola de tamaño máximo STREAM_QUEUE_SIZE. Encadenando
+etapas, red, CPU y base de datos trabajan a la vez, y cuando una etapa se
+atasca las anteriores se bloquean (backpressure): en memoria solo hay unos
+pocos trozos por etapa.
+
+Uso:
+    for tdf in staged(iter_source("who"), transform_who):
+        load(tdf)
+
+Una excepción en la etapa se relanza en el consumidor; si el consumidor deja
+de iterar, la etapa se detiene al intentar entregar el siguiente resultado.
+"""
+
+from __future__ import annotations
+import os
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "2"))
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def staged(
+    items: Iterable[T],
+    fn: Callable[[T], U],
+    maxsize: int | None = None,
+    name: str = "stage",
+) -> Iterator[U]:
+    """Itera `fn(x)` para cada x de `items`, calculados en un hilo con cola acotada."""
+    out: queue.Queue = queue.Queue(maxsize=max(1, maxsize or STREAM_QUEUE_SIZE))
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _work() -> None:
+        try:
+            for x in items:
+                if not _put(fn(x)):
+                    return
+        except BaseException as e:  # se relanza en el consumidor
+            _put(_Failed(e))
+            return
+        finally:
+            close = getattr(items, "close", None)
+            if stop.is_set() and close is not None:
+                close()
+        _put(_DONE)
+
+    worker = threading.Thread(target=_work, name=name, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        worker.join()
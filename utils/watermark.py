@@ -0,0 +1,99 @@
+"""Marcas de agua de extracción incremental en staging.extract_watermark.
+
+Una fila por (source, indicator) con el último año cargado y el instante de
+la última extracción correcta. Los extractores piden solo el delta:
+    - World Bank: rango `date=` desde last_year - lookback.
+    - WHO GHO:    filtro `TimeDim ge` desde last_year - lookback.
+    - SDMX:       `updatedAfter=last_updated`.
+Uso:
+    since = read_watermarks(engine, "worldbank")   # {} → extracción completa
+    ...
+    update_watermarks(engine, "worldbank", df, extracted_at)
+"""
+
+from __future__ import annotations
+import os
+from datetime import datetime
+from typing import NamedTuple
+
+import pandas as pd
+from sqlalchemy import text
+
+STAGING = os.getenv("STAGING_SCHEMA", "staging")
+
+# Años que se vuelven a pedir por debajo de la marca (las fuentes revisan datos recientes)
+WATERMARK_LOOKBACK_YEARS = int(os.getenv("WATERMARK_LOOKBACK_YEARS", "2"))
+
+CREATE_TABLE_WATERMARK = f"""
+CREATE TABLE IF NOT EXISTS {STAGING}.extract_watermark (
+  source       TEXT NOT NULL,
+  indicator    TEXT NOT NULL,
+  last_year    INT,
+  last_updated TIMESTAMPTZ,
+  CONSTRAINT pk_extract_watermark PRIMARY KEY (source, indicator)
+);"""
+
+SELECT_SQL = (
+    f"SELECT indicator, last_year, last_updated FROM {STAGING}.extract_watermark "
+    f"WHERE source=:source;"
+)
+UPSERT_SQL = f"""
+INSERT INTO {STAGING}.extract_watermark (source, indicator, last_year, last_updated)
+VALUES (:source, :indicator, :last_year, :last_updated)
+ON CONFLICT (source, indicator)
+DO UPDATE SET last_year    = GREATEST({STAGING}.extract_watermark.last_year, EXCLUDED.last_year),
+              last_updated = GREATEST({STAGING}.extract_watermark.last_updated, EXCLUDED.last_updated);"""
+
+
+class Watermark(NamedTuple):
+    last_year: int | None
+    last_updated: datetime | None
+
+
+def ensure_watermark_table(engine):
+    """Crea esquema y tabla si faltan (idempotente)."""
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {STAGING};"))
+        conn.execute(text(CREATE_TABLE_WATERMARK))
+
+
+def read_watermarks(engine, source: str) -> dict[str, Watermark]:
+    """{indicador: Watermark} de la fuente (vacío si nunca se ha cargado)."""
+    with engine.begin() as conn:
+        rows = conn.execute(text(SELECT_SQL), {"source": source}).all()
+    return {ind: Watermark(year, ts) for ind, year, ts in rows}
+
+
+def update_watermarks(engine, source: str, df: pd.DataFrame, extracted_at: datetime):
+    """Avanza la marca de cada indicador presente en `df` (año máximo cargado)."""
+    if df is None or df.empty or "indicator" not in df.columns or "year" not in df.columns:
+        return
+    last_years = df.groupby("indicator", observed=True)["year"].max()
+    params = [
+        {"source": source, "indicator": ind, "last_year": int(year), "last_updated": extracted_at}
+        for ind, year in last_years.items() if pd.notna(year)
+    ]
+    if params:
+        with engine.begin() as conn:
+            conn.execute(text(UPSERT_SQL), params)
+
+
+def start_year(since: dict[str, Watermark] | None, indicator: str, default: int) -> int:
+    """Primer año a pedir para un indicador: last_year - lookback, nunca antes de `default`."""
+    wm = (since or {}).get(indicator)
+    if wm is None or wm.last_year is None:
+        return default
+    return max(default, wm.last_year - WATERMARK_LOOKBACK_YEARS)
+
+
+def updated_after(since: dict[str, Watermark] | None, indicators) -> datetime | None:
+    """Marca `updatedAfter` común a un grupo de indicadores (la más antigua).
+
+    None (extracción completa) si alguno de ellos no tiene marca todavía.
+    """
+    if not since:
+        return None
+    stamps = [since[i].last_updated if i in since else None for i in indicators]
+    if not stamps or any(ts is None for ts in stamps):
+        return None
+    return min(stamps)